@@ -0,0 +1,100 @@
+
+# Writer of output products, off the critical path of the processing
+
+import atexit
+import queue
+import threading
+import weakref
+import numpy as np
+
+class asyncWriter:
+    """
+    Write jobs (a writing function, such as writeToa, and its arguments) run according to a mode:
+    'async': by a background thread fed through a bounded queue. The processing only
+             waits when the queue is full (backpressure)
+    'sync': immediately, in the calling thread
+    """
+    def __init__(self, mode='async', maxqueue=4):
+        if mode not in ('async', 'sync'):
+            raise Exception('Unknown write mode ' + str(mode))
+        self.mode = mode
+        self.errors = []
+        self.queue = None
+        if mode == 'async':
+            self.queue = queue.Queue(maxsize=maxqueue)
+            self.thread = threading.Thread(target=self.run, name='asyncWriter', daemon=True)
+            self.thread.start()
+            _writers.add(self)
+
+    def submit(self, func, *args):
+        '''
+        Queues a write
+        :param func: writing function
+        :param args: arguments of the function. Arrays are copied, so the caller
+                     can keep modifying them (e.g. the in-place stages)
+        :return: NA
+        '''
+        if self.mode == 'sync':
+            func(*args)
+            return
+        args = tuple(np.array(arg) if isinstance(arg, np.ndarray) else arg for arg in args)
+        self.queue.put((func, args)) # Blocks while the queue is full
+
+    def run(self):
+        while True:
+            job = self.queue.get()
+            if job is None: # Stop, queued by close after the pending writes
+                self.queue.task_done()
+                return
+            func, args = job
+            try:
+                func(*args)
+            except Exception as e:
+                self.errors.append(e)
+            finally:
+                self.queue.task_done()
+
+    def flush(self, logger=None):
+        '''
+        Waits until all the queued products are written
+        :param logger: optional logger to report the failed writes
+        :return: NA. Raises the first error of the failed writes
+        '''
+        if self.mode == 'sync':
+            return
+        self.queue.join()
+        self.raiseErrors(logger)
+
+    def close(self, logger=None):
+        '''
+        Writes the queued products and stops the background thread. The next writes,
+        if any, are done in the calling thread
+        :param logger: optional logger to report the failed writes
+        :return: NA. Raises the first error of the failed writes
+        '''
+        if self.mode == 'sync':
+            return
+        self.queue.put(None)
+        self.thread.join()
+        self.mode = 'sync'
+        self.raiseErrors(logger)
+
+    def raiseErrors(self, logger=None):
+        errors = self.errors
+        self.errors = []
+        if errors:
+            for e in errors:
+                if logger is not None:
+                    logger.error("Write failed: " + str(e))
+            raise errors[0]
+
+# Writers of the process, closed at its exit so that the queued products are not lost
+_writers = weakref.WeakSet()
+
+@atexit.register
+def closeWriters():
+    for writer in list(_writers):
+        try:
+            writer.close()
+        except Exception as e:
+            print("Write failed: " + str(e))
@@ -4,6 +4,7 @@ import numpy as np
 import os
 import sys
 from common.io.mkdirOutputdir import mkdirOutputdir
+from common.io.ncLock import ncLock
 
 def writeL1c(outputdir, name, lat, lon, toa):
 
@@ -13,30 +14,31 @@ def writeL1c(outputdir, name, lat, lon, toa):
     # TOA filename
     savetostr = os.path.join(outputdir, name + '.nc')
 
-    # open a netCDF file to write
-    ncout = Dataset(savetostr, 'w', format='NETCDF4')
-
-    # define axis size
-    ncout.createDimension('npoints', len(lat))
-
-    # create variable array
-    toa_scene = ncout.createVariable('toa', 'float32', ('npoints',))
-    toa_scene.units = 'mW/m2/sr'
-    toa_scene.description = "L1C radiances"
-    lat_scene = ncout.createVariable('lat', 'float32', ('npoints',))
-    lat_scene.units = 'degrees'
-    lat_scene.description = "L1C geodetic latitude"
-    lon_scene = ncout.createVariable('lon', 'float32', ('npoints',))
-    lon_scene.units = 'degrees'
-    lon_scene.description = "L1C geodetic longitude"
-
-    # Assign data
-    toa_scene[:]         = toa[:]
-    lat_scene[:]         = lat[:]
-    lon_scene[:]         = lon[:]
-
-    # close files
-    ncout.close()
+    with ncLock:
+        # open a netCDF file to write
+        ncout = Dataset(savetostr, 'w', format='NETCDF4')
+
+        # define axis size
+        ncout.createDimension('npoints', len(lat))
+
+        # create variable array
+        toa_scene = ncout.createVariable('toa', 'float32', ('npoints',))
+        toa_scene.units = 'mW/m2/sr'
+        toa_scene.description = "L1C radiances"
+        lat_scene = ncout.createVariable('lat', 'float32', ('npoints',))
+        lat_scene.units = 'degrees'
+        lat_scene.description = "L1C geodetic latitude"
+        lon_scene = ncout.createVariable('lon', 'float32', ('npoints',))
+        lon_scene.units = 'degrees'
+        lon_scene.description = "L1C geodetic longitude"
+
+        # Assign data
+        toa_scene[:]         = toa[:]
+        lat_scene[:]         = lat[:]
+        lon_scene[:]         = lon[:]
+
+        # close files
+        ncout.close()
 
     print("Finished writting: " + savetostr)
 
@@ -0,0 +1,6 @@
+# Lock of the netCDF files. The netCDF/HDF5 library is not thread safe, so the
+# readers and writers that can run in parallel threads (e.g. one per band) hold it
+
+import threading
+
+ncLock = threading.RLock()
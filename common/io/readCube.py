@@ -3,8 +3,18 @@ import numpy as np
 import os
 import sys
 from common.io.mkdirOutputdir import mkdirOutputdir
+from common.io.ncLock import ncLock
 
-def readCube(directory, filename):
+def readCube(directory, filename, wv_min=None, wv_max=None):
+    '''
+    Reads the TOA cube of the SGM
+    :param directory: directory
+    :param filename: name of the cube (sgm_toa.nc)
+    :param wv_min: optional, minimum wavelength to read [nm]
+    :param wv_max: optional, maximum wavelength to read [nm]
+    :return: TOA cube (lines x columns x wavelengths) and wavelengths.
+    Only the wavelengths within [wv_min, wv_max] are read from the file.
+    '''
 
     # concatenate filename and check that it exists
     ncfile = os.path.join(directory, filename)
@@ -12,18 +22,68 @@ def readCube(directory, filename):
         sys.exit('File not found ' +ncfile + ". Exiting.")
     print('Reading ' + ncfile)
 
-    # Load dataset
-    dset = Dataset(ncfile)
+    with ncLock:
+        # Load dataset
+        dset = Dataset(ncfile)
+        dset.set_auto_mask(False)
 
-    # Extract data from NetCDF file
-    toa = np.array(dset.variables['toa'][:])
-    wv = np.array(dset.variables['wv'][:])
-    dset.close()
+        # Extract data from NetCDF file. Hyperslab on the wavelengths of the window
+        wv = dset.variables['wv'][:]
+        iwv = wavelengthWindow(wv, wv_min, wv_max)
+        toa = dset.variables['toa'][:, :, iwv]
+        wv = wv[iwv]
+        dset.close()
     print('Size of cube ' + str(toa.shape))
     
     return toa, wv
 
-def writeCube(directory, filename, toa, wv):
+def readCubeWv(directory, filename):
+    '''
+    Reads only the wavelengths of the TOA cube of the SGM
+    :param directory: directory
+    :param filename: name of the cube (sgm_toa.nc)
+    :return: wavelengths [nm]
+    '''
+    ncfile = os.path.join(directory, filename)
+    if not os.path.isfile(ncfile):
+        sys.exit('File not found ' +ncfile + ". Exiting.")
+
+    with ncLock:
+        dset = Dataset(ncfile)
+        wv = np.array(dset.variables['wv'][:])
+        dset.close()
+
+    return wv
+
+def wavelengthWindow(wv, wv_min=None, wv_max=None):
+    '''
+    Contiguous range of the wavelengths within [wv_min, wv_max]
+    :param wv: wavelengths
+    :param wv_min: minimum wavelength. None for no limit
+    :param wv_max: maximum wavelength. None for no limit
+    :return: slice over the wavelength dimension
+    '''
+    inside = np.ones(wv.shape, dtype=bool)
+    if wv_min is not None:
+        inside &= wv >= wv_min
+    if wv_max is not None:
+        inside &= wv <= wv_max
+    iwv = np.flatnonzero(inside)
+    if iwv.size == 0:
+        sys.exit('No wavelengths of the cube within [' + str(wv_min) + ', ' + str(wv_max) + ']. Exiting.')
+    return slice(iwv[0], iwv[-1] + 1)
+
+def writeCube(directory, filename, toa, wv, chunksizes=None, zlib=False):
+    '''
+    Writes a TOA cube with the SGM format
+    :param directory: output directory
+    :param filename: name of the file, without extension
+    :param toa: TOA cube (lines x columns x wavelengths)
+    :param wv: wavelengths [nm]
+    :param chunksizes: optional netCDF chunk shape of the toa variable (lines, columns, wavelengths)
+    :param zlib: compress the toa variable
+    :return: NA
+    '''
 
     # Check output directory
     mkdirOutputdir(directory)
@@ -41,7 +101,8 @@ def writeCube(directory, filename, toa, wv):
 
     # create variable array
     floris_toa_scene = ncout.createVariable('toa', 'float32',
-                                            ('n_lines', 'n_columns','n_wavelengths',))
+                                            ('n_lines', 'n_columns','n_wavelengths',),
+                                            chunksizes=chunksizes, zlib=zlib)
     floris_toa_scene.units = 'mW/sr/m2/nm'
     floris_toa_scene.description = "TOA spectral radiances"
     wavelengths = ncout.createVariable('wv', 'float32', ('n_wavelengths',))
@@ -56,3 +117,55 @@ def writeCube(directory, filename, toa, wv):
     ncout.close()
 
     print("Finished writting: " + savetostr)
+
+def ingestCube(directory, filename, outdir, outname, chunk_wv=16, chunk_bytes=4*1024*1024, zlib=False):
+    '''
+    Rewrites a TOA cube of the SGM with a chunking suited to band-wise reads
+    (see readCube wv_min/wv_max): every chunk spans few wavelengths and many
+    lines and columns. The cube is copied by blocks of lines.
+    :param directory: input directory
+    :param filename: input cube (sgm_toa.nc)
+    :param outdir: output directory
+    :param outname: name of the output file, without extension
+    :param chunk_wv: wavelengths per chunk
+    :param chunk_bytes: target size of each chunk [bytes]
+    :param zlib: compress the toa variable
+    :return: NA
+    '''
+    ncfile = os.path.join(directory, filename)
+    if not os.path.isfile(ncfile):
+        sys.exit('File not found ' +ncfile + ". Exiting.")
+    print('Ingesting ' + ncfile)
+
+    dset = Dataset(ncfile)
+    dset.set_auto_mask(False)
+    toa_in = dset.variables['toa']
+    wv = dset.variables['wv'][:]
+    nlines, ncolumns, nwv = toa_in.shape
+
+    chunk_wv = min(chunk_wv, nwv)
+    chunk_lines = int(min(nlines, max(1, chunk_bytes // (4 * ncolumns * chunk_wv))))
+
+    mkdirOutputdir(outdir)
+    savetostr = os.path.join(outdir, outname + '.nc')
+    ncout = Dataset(savetostr, 'w', format='NETCDF4')
+    ncout.createDimension('n_lines', nlines)
+    ncout.createDimension('n_columns', ncolumns)
+    ncout.createDimension('n_wavelengths', nwv)
+    toa_out = ncout.createVariable('toa', 'float32', ('n_lines', 'n_columns','n_wavelengths',),
+                                   chunksizes=(chunk_lines, ncolumns, chunk_wv), zlib=zlib)
+    toa_out.units = 'mW/sr/m2/nm'
+    toa_out.description = "TOA spectral radiances"
+    wavelengths = ncout.createVariable('wv', 'float32', ('n_wavelengths',))
+    wavelengths.units = 'nm'
+    wavelengths.description = "Wavelengths in nanometers"
+    wavelengths[:] = wv
+
+    # Copy a band of chunks at a time, to keep the memory bounded
+    for iline in range(0, nlines, chunk_lines):
+        toa_out[iline:iline+chunk_lines, :, :] = toa_in[iline:iline+chunk_lines, :, :]
+
+    ncout.close()
+    dset.close()
+
+    print("Finished writting: " + savetostr + ", chunks " + str((chunk_lines, ncolumns, chunk_wv)))
@@ -4,6 +4,7 @@ import numpy as np
 import sys
 import os
 from common.io.mkdirOutputdir import mkdirOutputdir
+from common.io.ncLock import ncLock
 
 EQ_MULT = "equalization_multiplicative_factor"
 EQ_ADD = "equalization_additive_factor"
@@ -22,12 +23,13 @@ def readFactor(ncfile, varname):
         sys.exit('File not found ' +ncfile + ". Exiting.")
     print('Reading ' + ncfile)
 
-    # Load dataset
-    dset = Dataset(ncfile)
+    with ncLock:
+        # Load dataset
+        dset = Dataset(ncfile)
 
-    # Extract data from NetCDF file
-    gain = np.array(dset.variables[varname][:])
-    dset.close()
+        # Extract data from NetCDF file
+        gain = np.array(dset.variables[varname][:])
+        dset.close()
     print('Size of matrix ' + str(gain.shape))
 
     return gain
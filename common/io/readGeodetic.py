@@ -2,6 +2,7 @@ from netCDF4 import Dataset
 import numpy as np
 import os
 import sys
+from common.io.ncLock import ncLock
 
 def readGeodetic(directory, filename):
     '''
@@ -16,14 +17,15 @@ def readGeodetic(directory, filename):
         sys.exit('File not found ' +ncfile + ". Exiting.")
     print('Reading ' + ncfile)
 
-    # Load dataset
-    dset = Dataset(ncfile)
+    with ncLock:
+        # Load dataset
+        dset = Dataset(ncfile)
 
-    # Extract data from NetCDF file
-    lat = np.array(dset.groups['projection'].variables['latitude'][:])
-    lon = np.array(dset.groups['projection'].variables['longitude'][:])
+        # Extract data from NetCDF file
+        lat = np.array(dset.groups['projection'].variables['latitude'][:])
+        lon = np.array(dset.groups['projection'].variables['longitude'][:])
 
-    dset.close()
+        dset.close()
     print('Size of matrix ' + str(lat.shape))
 
     return lat, lon
@@ -1,18 +1,20 @@
 from netCDF4 import Dataset
 import numpy as np
+from common.io.ncLock import ncLock
 
 def readIsrf(isrffile, b):
 
     ncfile = isrffile + b + '.nc'
     print('Reading ' + ncfile)
 
-    # Load dataset
-    dset = Dataset(ncfile)
+    with ncLock:
+        # Load dataset
+        dset = Dataset(ncfile)
 
-    # Extract data from NetCDF file
-    isrf = np.array(dset.variables['isrf'][:])
-    wv_isrf = np.array(dset.variables['wavelength'][:])
+        # Extract data from NetCDF file
+        isrf = np.array(dset.variables['isrf'][:])
+        wv_isrf = np.array(dset.variables['wavelength'][:])
 
-    dset.close()
+        dset.close()
 
     return isrf, wv_isrf
@@ -3,9 +3,22 @@ from netCDF4 import Dataset
 import numpy as np
 import os
 import sys
+import queue
+import threading
 from common.io.mkdirOutputdir import mkdirOutputdir
+from common.io.ncLock import ncLock
 
-def writeToa(outputdir, name, toa):
+def writeToa(outputdir, name, toa, compression=None, complevel=4):
+    """
+    Writes a TOA image to a netCDF file
+    :param outputdir: output directory
+    :param name: name of the file (without extension)
+    :param toa: TOA image. Integer images (digital numbers) are stored with their
+                type (e.g. uint16), any other as float32
+    :param compression: None, 'zlib' or 'zstd'. Compressed variables are also byte-shuffled
+    :param complevel: compression level
+    :return: NA
+    """
 
     # Check output directory
     mkdirOutputdir(outputdir)
@@ -13,22 +26,26 @@ def writeToa(outputdir, name, toa):
     # TOA filename
     savetostr = os.path.join(outputdir, name + '.nc')
 
-    # open a netCDF file to write
-    ncout = Dataset(savetostr, 'w', format='NETCDF4')
+    with ncLock:
+        # open a netCDF file to write
+        ncout = Dataset(savetostr, 'w', format='NETCDF4')
     
-    # define axis size
-    ncout.createDimension('alt_lines', toa.shape[0])  # unlimited
-    ncout.createDimension('act_columns', toa.shape[1])
+        # define axis size
+        ncout.createDimension('alt_lines', toa.shape[0])  # unlimited
+        ncout.createDimension('act_columns', toa.shape[1])
 
-    # create variable array
-    floris_toa_scene = ncout.createVariable('toa', 'float32',
-                                            ('alt_lines', 'act_columns',))
+        # create variable array
+        dtype = toa.dtype if np.issubdtype(toa.dtype, np.integer) else np.dtype('float32')
+        floris_toa_scene = ncout.createVariable('toa', dtype,
+                                                ('alt_lines', 'act_columns',),
+                                                compression=compression, complevel=complevel,
+                                                shuffle=compression is not None)
 
-    # Assign data
-    floris_toa_scene[:]         = toa[:]
+        # Assign data
+        floris_toa_scene[:]         = toa[:]
     
-    # close files
-    ncout.close()
+        # close files
+        ncout.close()
 
     print("Finished writting: " + savetostr)
 
@@ -40,14 +57,104 @@ def readToa(directory, filename):
         sys.exit('File not found ' +ncfile + ". Exiting.")
     print('Reading ' + ncfile)
 
-    # Load dataset
-    dset = Dataset(ncfile)
+    with ncLock:
+        # Load dataset
+        dset = Dataset(ncfile)
 
-    # Extract data from NetCDF file
-    toa = np.array(dset.variables['toa'][:])
+        # Extract data from NetCDF file, with the stored type (float32, or uint16 for DN)
+        var = dset.variables['toa']
+        var.set_auto_mask(False)
+        toa = np.array(var[:])
 
-    dset.close()
+        dset.close()
 
     print('Size of matrix ' + str(toa.shape))
 
     return toa
+
+def readToaBlocks(directory, filename, block_lines, prefetch=2):
+    """
+    Reads a TOA image by blocks of lines (ALT), as netCDF hyperslabs
+    :param directory: directory
+    :param filename: name of the file
+    :param block_lines: lines of each block
+    :param prefetch: blocks read ahead by a background thread (0 to read in the calling thread)
+    :return: generator of (first line, block), with the stored type
+    """
+    ncfile = os.path.join(directory, filename)
+    if not os.path.isfile(ncfile):
+        sys.exit('File not found ' +ncfile + ". Exiting.")
+    print('Reading ' + ncfile + ' by blocks of ' + str(block_lines) + ' lines')
+
+    def blocks():
+        with ncLock:
+            dset = Dataset(ncfile)
+            var = dset.variables['toa']
+            var.set_auto_mask(False)
+            nlines = var.shape[0]
+        try:
+            for iline in range(0, nlines, block_lines):
+                with ncLock:
+                    block = var[iline:iline+block_lines, :]
+                yield iline, block
+        finally:
+            with ncLock:
+                dset.close()
+
+    if prefetch <= 0:
+        yield from blocks()
+        return
+
+    # Read ahead in a background thread, so that reading overlaps with the processing
+    ready = queue.Queue(maxsize=prefetch)
+    def reader():
+        try:
+            for item in blocks():
+                ready.put(item)
+        except Exception as e:
+            ready.put(e)
+        ready.put(None)
+    threading.Thread(target=reader, daemon=True).start()
+    while True:
+        item = ready.get()
+        if item is None:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+class toaAppender:
+    """
+    TOA netCDF file written by blocks of lines, appended along an unlimited ALT dimension
+    """
+    def __init__(self, outputdir, name, ncolumns, dtype='float32', block_lines=None, compression=None, complevel=4):
+        """
+        :param outputdir: output directory
+        :param name: name of the file (without extension)
+        :param ncolumns: number of columns (ACT)
+        :param dtype: type of the stored values
+        :param block_lines: lines of the blocks (netCDF chunks)
+        :param compression: None, 'zlib' or 'zstd' (byte-shuffled)
+        :param complevel: compression level
+        """
+        mkdirOutputdir(outputdir)
+        self.savetostr = os.path.join(outputdir, name + '.nc')
+        self.nlines = 0
+        chunksizes = None if block_lines is None else (block_lines, ncolumns)
+        with ncLock:
+            self.ncout = Dataset(self.savetostr, 'w', format='NETCDF4')
+            self.ncout.createDimension('alt_lines', None)  # unlimited
+            self.ncout.createDimension('act_columns', ncolumns)
+            self.var = self.ncout.createVariable('toa', dtype, ('alt_lines', 'act_columns',),
+                                                 compression=compression, complevel=complevel,
+                                                 shuffle=compression is not None, chunksizes=chunksizes)
+
+    def append(self, block):
+        with ncLock:
+            self.var[self.nlines:self.nlines+block.shape[0], :] = block
+        self.nlines += block.shape[0]
+
+    def close(self):
+        with ncLock:
+            self.ncout.close()
+        print("Finished writting: " + self.savetostr)
@@ -0,0 +1,104 @@
+
+# Queue of plot jobs, rendered off the critical path of the processing
+
+import atexit
+import multiprocessing
+import pickle
+import threading
+
+def initWorker():
+    # Headless backend for the background processes
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    plt.switch_backend('Agg')
+
+def runJob(payload):
+    func, args = pickle.loads(payload)
+    func(*args)
+
+class plotQueue:
+    """
+    Plot jobs (a plotting function and its arguments) rendered according to a mode:
+    'async': in a pool of background processes, the processing does not wait for them
+    'sync': immediately, in the calling thread
+    'none': not rendered at all (production)
+    """
+    def __init__(self, mode='async', workers=1):
+        if mode not in ('async', 'sync', 'none'):
+            raise Exception('Unknown plot mode ' + str(mode))
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.jobs = []
+        self.pool = None
+        if mode == 'async':
+            method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+            self.pool = multiprocessing.get_context(method).Pool(workers, initializer=initWorker)
+
+    def submit(self, func, *args):
+        '''
+        Queues a plot
+        :param func: plotting function (module-level, so that it can be sent to another process)
+        :param args: arguments of the function
+        :return: NA
+        '''
+        if self.mode == 'none':
+            return
+        if self.mode == 'sync':
+            with self.lock: # pyplot is not thread safe
+                func(*args)
+            return
+        # Serialise now, so that the arrays can be modified after the call
+        payload = pickle.dumps((func, args), protocol=pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.jobs.append(self.pool.apply_async(runJob, (payload,)))
+
+    def flush(self, logger=None):
+        '''
+        Waits until all the queued plots are rendered
+        :param logger: optional logger to report the failed plots
+        :return: NA
+        '''
+        with self.lock:
+            jobs = self.jobs
+            self.jobs = []
+        for job in jobs:
+            try:
+                job.get()
+            except Exception as e:
+                if logger is not None:
+                    logger.warning("Plot failed: " + str(e))
+                else:
+                    print("Plot failed: " + str(e))
+
+    def close(self):
+        self.flush()
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+# Queue shared by all the modules of the process
+_queues = {}
+_queues_lock = threading.Lock()
+
+def getPlotQueue(mode='async', workers=1):
+    '''
+    Returns the process-wide plot queue of a mode, creating it the first time
+    :param mode: 'async', 'sync' or 'none'
+    :param workers: number of background processes (async mode)
+    :return: plotQueue
+    '''
+    with _queues_lock:
+        if mode not in _queues:
+            _queues[mode] = plotQueue(mode, workers)
+        return _queues[mode]
+
+@atexit.register
+def closePlotQueues():
+    # Renders the pending plots and shuts the background processes down at the exit of the process
+    with _queues_lock:
+        queues = list(_queues.values())
+        _queues.clear()
+    for queue in queues:
+        queue.close()
@@ -0,0 +1,209 @@
+
+# Cache of precomputed arrays, in memory and on disk, with LRU eviction
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+
+def hashFile(filename, blocksize=1 << 20):
+    '''
+    Checksum of the contents of a file
+    :param filename: file
+    :param blocksize: bytes read at a time
+    :return: hexadecimal SHA-1 digest
+    '''
+    h = hashlib.sha1()
+    with open(filename, 'rb') as fid:
+        for block in iter(lambda: fid.read(blocksize), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def fileKey(filename):
+    '''
+    Cheap key of a file, from its metadata (path, size and modification time), for large
+    inputs whose contents would be too expensive to hash
+    :param filename: file
+    :return: hexadecimal SHA-1 digest
+    '''
+    stat = os.stat(filename)
+    return hashKey(os.path.abspath(filename), stat.st_size, stat.st_mtime_ns)
+
+def hashKey(*items):
+    '''
+    Key of a cache entry, hashing all the items that determine it
+    :param items: numpy arrays, strings, numbers, or lists/tuples of them
+    :return: hexadecimal SHA-1 digest
+    '''
+    h = hashlib.sha1()
+    for item in items:
+        if isinstance(item, (list, tuple)):
+            h.update(hashKey(*item).encode())
+        elif isinstance(item, np.ndarray):
+            h.update(str(item.dtype).encode() + str(item.shape).encode())
+            h.update(memoryview(np.ascontiguousarray(item)).cast('B'))
+        elif isinstance(item, bytes):
+            h.update(item)
+        else:
+            h.update(repr(item).encode())
+        h.update(b'|')
+    return h.hexdigest()
+
+def configKey(config, exclude=()):
+    '''
+    Key of a configuration object: all its fields except the flags to save
+    intermediate outputs (save_*) and the excluded ones
+    :param config: configuration object (globalConfig, ismConfig, etc.)
+    :param exclude: names of the fields that do not change the results
+    :return: hexadecimal SHA-1 digest
+    '''
+    fields = sorted((name, value) for name, value in vars(config).items()
+                    if name not in exclude and not name.startswith('save_'))
+    return hashKey(fields)
+
+class arrayCache:
+    """
+    LRU cache of numpy arrays (or dictionaries of arrays), kept in memory
+    and persisted as .npy/.npz files in a cache directory
+    """
+    def __init__(self, cachedir=None, maxitems=64, maxbytes=None, inmemory=True):
+        '''
+        :param cachedir: directory of the disk store. If None, only the memory cache is used
+        :param maxitems: maximum number of entries in memory and on disk
+        :param maxbytes: maximum size of the entries in memory, and of the disk store [bytes]. If None, no size limit
+        :param inmemory: keep the entries in memory too. False for large entries (disk store only)
+        '''
+        self.cachedir = cachedir
+        self.maxitems = maxitems
+        self.maxbytes = maxbytes
+        self.inmemory = inmemory or cachedir is None
+        self.memory = OrderedDict()
+        self.membytes = 0
+        self.lock = threading.Lock()
+        if cachedir is not None:
+            os.makedirs(cachedir, exist_ok=True)
+
+    def get(self, key):
+        '''
+        Looks up an entry, first in memory and then on disk
+        :param key: key of the entry (see hashKey)
+        :return: the cached value (read-only), or None if not found
+        '''
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                return self.memory[key][0]
+
+            filename = self.diskFile(key)
+            if filename is None:
+                return None
+            if filename.endswith('.npz'):
+                with np.load(filename) as data:
+                    value = {name: data[name] for name in data.files}
+            else:
+                value = np.load(filename)
+            os.utime(filename) # Most recently used
+            return self.remember(key, value)
+
+    def put(self, key, value):
+        '''
+        Stores an entry in memory and on disk
+        :param key: key of the entry (see hashKey)
+        :param value: numpy array, or dictionary of numpy arrays
+        :return: the stored value (read-only)
+        '''
+        with self.lock:
+            stored = self.remember(key, value)
+            if self.cachedir is None:
+                return stored
+
+            ext = '.npz' if isinstance(value, dict) else '.npy'
+            filename = os.path.join(self.cachedir, key + ext)
+            tmpfile = filename + '.tmp'
+            with open(tmpfile, 'wb') as fid:
+                if isinstance(value, dict):
+                    np.savez(fid, **value)
+                else:
+                    np.save(fid, value)
+            os.replace(tmpfile, filename)
+            self.evictDisk()
+            return stored
+
+    def remember(self, key, value):
+        '''
+        Keeps an entry in memory, as read-only views (the callers share it), evicting
+        the least recently used entries beyond the item and size budgets
+        :return: the read-only value
+        '''
+        value = readOnly(value)
+        if not self.inmemory:
+            return value
+        nbytes = sizeOf(value)
+        if self.maxbytes is not None and nbytes > self.maxbytes:
+            return value # Too large to be kept in memory
+        if key in self.memory:
+            self.membytes -= self.memory.pop(key)[1]
+        self.memory[key] = (value, nbytes)
+        self.membytes += nbytes
+        while len(self.memory) > self.maxitems or (self.maxbytes is not None and self.membytes > self.maxbytes):
+            self.membytes -= self.memory.popitem(last=False)[1][1]
+        return value
+
+    def diskFile(self, key):
+        if self.cachedir is None:
+            return None
+        for ext in ('.npy', '.npz'):
+            filename = os.path.join(self.cachedir, key + ext)
+            if os.path.isfile(filename):
+                return filename
+        return None
+
+    def evictDisk(self):
+        '''
+        Removes the least recently used files beyond the item and size budgets
+        '''
+        entries = []
+        for name in os.listdir(self.cachedir):
+            if name.endswith('.npy') or name.endswith('.npz'):
+                stat = os.stat(os.path.join(self.cachedir, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+        entries.sort(reverse=True) # Most recent first
+
+        total = 0
+        for iitem, (mtime, size, name) in enumerate(entries):
+            total += size
+            if iitem >= self.maxitems or (self.maxbytes is not None and total > self.maxbytes and iitem > 0):
+                os.remove(os.path.join(self.cachedir, name))
+
+def readOnly(value):
+    # Read-only views of an array, or of the arrays of a dictionary
+    if isinstance(value, dict):
+        return {name: readOnly(item) for name, item in value.items()}
+    view = value.view()
+    view.setflags(write=False)
+    return view
+
+def sizeOf(value):
+    # Size of an array, or of the arrays of a dictionary [bytes]
+    if isinstance(value, dict):
+        return sum(item.nbytes for item in value.values())
+    return value.nbytes
+
+# Caches shared by all the modules of the process, one per directory
+_caches = {}
+_caches_lock = threading.Lock()
+
+def getCache(cachedir, maxitems=64, maxbytes=None):
+    '''
+    Returns the process-wide cache of a directory, creating it the first time
+    :param cachedir: directory of the disk store (None for a memory-only cache)
+    :param maxitems: maximum number of entries
+    :param maxbytes: maximum size of the entries in memory, and of the disk store [bytes]
+    :return: arrayCache
+    '''
+    key = None if cachedir is None else os.path.abspath(cachedir)
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = arrayCache(cachedir, maxitems, maxbytes)
+        return _caches[key]
@@ -0,0 +1,116 @@
+import logging.config
+from config.globalConfig import globalConfig
+from auxiliary.constants import constants
+from common.io.fileExists import fileExists, addFileSep
+from common.src.arrayCache import getCache, arrayCache
+from common.plot.plotQueue import getPlotQueue
+from common.io.asyncWriter import asyncWriter
+import os
+
+class pipelineContext:
+    """
+    State shared by all the stages of a module run: directories, configuration,
+    logger, constants, caches and plot queue. It is created once per run and
+    handed to every stage, which then has no set-up cost of its own.
+    """
+    def __init__(self, auxdir, indir, outdir, modulestr):
+
+        # Check the input, output and auxiliary directories
+        # ----------------------------------------------------------------
+        #  Check that it can find the Auxiliary Folder
+        if not (fileExists(auxdir)):
+            raise Exception('Auxiliary folder not found ' + auxdir)
+        else:
+            self.auxdir = addFileSep(auxdir)
+
+        # Check whether there are one or two folders as inputs
+        indir = indir.split(',')
+        for istr in range(len(indir)):
+            if not (fileExists(indir[istr])):
+                raise Exception('Inputs folder not found ' + indir)
+            else:
+                indir[istr] = addFileSep(indir[istr])
+        if len(indir)==1: # If there is only one directory, remove the list
+            indir = indir[0]
+        # Assign
+        self.indir = indir
+
+        # Checks if the Output folder exists, if not creates it
+        if not (fileExists(outdir)):
+            print('Creating output folder ' + outdir)
+            os.mkdir(outdir, mode=0o777)
+            self.outdir = addFileSep(outdir)
+        else:
+            self.outdir = addFileSep(outdir)
+
+
+        # Initialise logger and global config
+        # ----------------------------------------------------------------
+        # Module name
+        self.modulestr = modulestr
+
+        # Global Config
+        self.globalConfig = globalConfig()
+
+        # Init logger
+        logstr = auxdir + os.path.sep + self.globalConfig.logconfigfile
+        if not (fileExists(logstr)):
+            raise Exception('Check the auxililary path and the logconf in the Global configuration. '
+                            'File not found: ' + logstr)
+
+        outlog = outdir + os.path.sep + modulestr + '.log'
+        logging.config.fileConfig(logstr,
+                                  defaults={'logfilename': outlog},
+                                  disable_existing_loggers=False)
+        self.logger = logging.getLogger(self.modulestr)
+
+        # The configuration sets the handlers of the root logger, which the next module of the
+        # process (E2E) configures again: they are moved to the logger of the module, so that
+        # each module keeps its own log file (and the other libraries do not write to it)
+        root = logging.getLogger()
+        self.logger.handlers = root.handlers[:]
+        self.logger.setLevel(root.level)
+        self.logger.propagate = False
+        root.handlers = []
+
+        # Get constants
+        self.constants = constants()
+
+        # Plots, rendered off the critical path
+        self.plotter = getPlotQueue(self.globalConfig.plot_mode, self.globalConfig.plot_workers)
+
+        # Output products, written off the critical path
+        self.writer = asyncWriter(self.globalConfig.write_mode, self.globalConfig.write_queue)
+
+        # Local configuration of the module (ismConfig, l1bConfig, l1cConfig), set by the module itself
+        self.ismConfig = None
+        self.l1bConfig = None
+        self.l1cConfig = None
+
+        # Stage outputs of previous runs (created on first use)
+        self.stageCache = None
+
+    def getCache(self, name):
+        """
+        Cache of precomputed arrays, shared by all the modules and runs using the same cache folder
+        :param name: name of the cache (subfolder)
+        :return: arrayCache
+        """
+        if self.globalConfig.cachedir is None:
+            cachedir = None
+        else:
+            cachedir = os.path.join(self.outdir, self.globalConfig.cachedir, name)
+        return getCache(cachedir, self.globalConfig.cache_max_items, self.globalConfig.cache_max_bytes)
+
+    def getStageCache(self):
+        """
+        Content-addressed store of the stage outputs (on disk, evicted by size)
+        :return: arrayCache, or None if the stage cache is disabled (neither stage_cache nor resume)
+        """
+        if not (self.globalConfig.stage_cache or self.globalConfig.resume) or self.globalConfig.cachedir is None:
+            return None
+        if self.stageCache is None:
+            self.stageCache = arrayCache(os.path.join(self.outdir, self.globalConfig.cachedir, 'stages'),
+                                         self.globalConfig.stage_cache_items,
+                                         self.globalConfig.stage_cache_bytes, inmemory=False)
+        return self.stageCache
@@ -28,6 +28,13 @@ class globalConfig:
         self.ism_toa_ds = 'ism_toa_ds_' # [e-] Electrons. Intermediate output after the Detection stage - Dark signal
         self.ism_toa_detection = 'ism_toa_detection_' # [e-] Digital numbers. Intermediate output after the Detection stage (after bad/dead pix)
         self.ism_toa_vcu = 'ism_toa_vcu_' # [DN] Digital numbers. Intermediate output after the Video Control Unit
+        self.ism_toa_ens_mean = 'ism_toa_ens_mean_' # [DN] Mean of the ensemble of realizations of the detection and video chain
+        self.ism_toa_ens_std = 'ism_toa_ens_std_' # [DN] Standard deviation of the ensemble
+        self.ism_toa_ens_pct = 'ism_toa_ens_p' # [DN] Percentiles of the ensemble. Attaches PERCENTILE + _ + BAND
+
+        # Compression of the TOA outputs in DN: None, 'zlib' or 'zstd' (byte-shuffled)
+        self.toa_compression = 'zlib'
+        self.toa_complevel = 4
 
         # Name of the TOA outputs of the L1B
         self.l1b_toa = "l1b_toa_" # [mW/m2/sr] Radiances. Output of the L1B
@@ -35,3 +42,29 @@ class globalConfig:
 
         # Name of the TOA outputs of the L1C
         self.l1c_toa = "l1c_toa_" # [mW/m2/sr] Radiances. Output of the L1C
+
+        # E2E chain in one process (ISM, L1B and L1C): whether the outputs of the ISM and the L1B
+        # are also written, or only handed over in memory to the next module
+        self.e2e_write_intermediate = False
+
+        # Cache of precomputed operators (spectral responses, etc.), shared between runs
+        self.cachedir = 'cache' # Relative to the output folder, or absolute path. None to keep it in memory only
+        self.cache_max_items = 64 # Maximum number of entries of each cache (LRU eviction)
+        self.cache_max_bytes = 1024**3 # [bytes] Size budget of each cache, in memory and on disk (LRU eviction)
+
+        # Stage cache: outputs of each stage (per band), keyed on the hash of their inputs,
+        # configuration and auxiliary files. They are reused in resume mode (--resume).
+        # Enabled by the resume mode, or for all the runs with stage_cache
+        self.stage_cache = False
+        self.stage_cache_items = 256
+        self.stage_cache_bytes = 4*1024**3 # [bytes] Size budget of the stage cache (LRU eviction)
+        self.resume = False
+
+        # Plots. 'async': rendered by background processes, without waiting for them,
+        # 'sync': rendered during the processing, 'none': no plots (production)
+        self.plot_mode = 'async'
+        self.plot_workers = 2 # Background processes of the async mode
+
+        # Writes of the output products. 'async': by a background thread, 'sync': during the processing
+        self.write_mode = 'async'
+        self.write_queue = 4 # Products waiting to be written before the processing blocks (async mode)
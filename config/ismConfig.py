@@ -31,7 +31,11 @@ class ismConfig:
         self.defocus = 2                         # [-] Defocus coefficient (defocus/(f/N)). 0-2 low defocusing
         self.ksmear = 0.191                      # [pixels] Coefficient for the smearing ALT
         self.kmotion = 0.02                      # [pixels] Amplitude of high-frequency component for the motion smear MTF in ALT and ACT
-        self.kernel_half_width = 0.5             # [pixels] Half-width of the kernel
+        self.kernel_half_width = 3               # [pixels] Half-width of the PSF kernel (do_psf_conv)
+        # Accuracy of the PSF convolution against the MTF (ism/Test/psf_test.py), max error relative to the
+        # contrast of the image, 100x150 image, smooth / random content:
+        # half-width 1: 2.4% / 13%, 3: 2.2% / 5.5%, 5: 2.0% / 3.4%, 8: 1.9% / 2.6%, 12: 1.5% / 1.7%,
+        # half the image (full kernel, all the separable terms): 1e-14
         self.kernel_step = 0.1                   # [pixels] Sampling of the kernel
 
         # Central wavelength of the band
@@ -46,6 +50,7 @@ class ismConfig:
         self.dead_pix = 0.5                      # [%]
         self.bad_pix_red = 0.1                   # [-] Reduction in the quantum efficiency of the pixel (over 1)
         self.dead_pix_red = 0.4                  # [-]
+        self.bad_dead_layout = 'regular'         # 'regular': evenly spaced (bad from column 5, dead from column 0), 'random': from the seed
         self.kprnu = 0.04                        # 4% Coefficient by which we multiply the PRNU standard normal distribution
         # Dark signal modelling
         self.kdsnu = 0.2                         # 20% Coefficient by which we multiply the DSNU standard normal distribution
@@ -58,6 +63,7 @@ class ismConfig:
         self.ADC_gain = 0.56                     # [-]
         self.OCF = 5.4e-6                        # [V/e-] Output conversion factor
         self.bit_depth = 12                      # [-]
+        self.dn_dtype = 'uint16'                 # Numeric type of the digital numbers ('float64' for the legacy output)
         self.min_voltage = 0.0                   # [V]
         self.max_voltage = 0.86                  # [V]
 
@@ -86,3 +92,37 @@ class ismConfig:
         self.apply_prnu = True
         self.apply_dark_signal = True
         self.apply_bad_dead = True
+
+        # Performance options
+        #--------------------------------------------------------------------------------
+        # Integrate the ISRF of all the bands in a single pass over the SGM cube
+        self.multiband_isrf = True
+        # Read from the SGM cube only the wavelengths within the ISRF of the bands
+        self.read_wv_window = True
+        # FFT for the application of the MTF. 'fft': complex FFT (reference), 'rfft': real-to-complex FFT
+        self.fft_backend = 'rfft'
+        self.fft_precision = 'float64'           # 'float64' or 'float32' (rfft only)
+        self.fft_workers = None                  # Threads of the FFT of each band (rfft only). -1: all the CPUs.
+                                                 # None: the CPUs shared among the band_workers
+        # Detection and video chain phases fused in a single in-place kernel
+        self.fused_radiometry = True
+        self.fused_block_bytes = 1024*1024       # [bytes] Size of the blocks of lines processed at a time
+        # Compiled radiometry: the fused chain collapsed into one gain/offset per column (fused_radiometry only).
+        # Not used if intermediate detection outputs are saved. Values on a DN rounding boundary may differ by 1 DN
+        self.compiled_radiometry = False
+        # Monte Carlo ensemble of the detection and video chain (PRNU/DSNU realizations) on the optical
+        # output of each band. Writes the per-pixel mean, std and percentiles of the DN. 0: disabled
+        self.ensemble_size = 0
+        self.ensemble_chunk_bytes = 256*1024*1024 # [bytes] Memory of each batch of realizations
+        self.ensemble_percentiles = [5, 50, 95]  # [%]
+        self.ensemble_hist_bins = 64             # Bins per pixel of the histogram of the percentiles
+        # Bands processed in parallel (threads)
+        self.band_workers = 4
+        # Evaluation of the MTF. 'grid': every contributor on the 2D frequency grid (reference),
+        # 'radial': radial contributors on a 1D profile of mtf_lut_samples radii, mapped to the 2D grid
+        self.mtf_evaluator = 'radial'
+        self.mtf_lut_samples = 8192
+        # PSF convolution (do_psf_conv)
+        self.psf_tile_lines = 256                # Lines of each tile of the convolution
+        self.psf_separable_tol = 1e-6            # Relative singular value below which the separable terms are dropped
+                                                 # (full kernel: 1e-3 gives errors of 1-2% of the contrast, 1e-6 below 1e-5)
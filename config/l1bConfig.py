@@ -9,6 +9,19 @@ class l1bConfig:
 
         # Flags to enable or disable the equalization
         self.do_equalization = False
+        self.save_eq_stage = True # Save the TOA after the equalization (l1b_toa_eq_)
+
+        # Equalization and restoration folded into a gain and offset per column, applied in one pass
+        self.fused_calibration = True
+        # Integer DN calibrated with a lookup table of the 2**bit_depth codes. 'none': gain and offset,
+        # 'band': one table per band, only without equalization, 'column': also with equalization (a table per column,
+        # slower than the gain and offset with numpy)
+        self.calibration_lut = 'band'
+        self.bit_depth = 12 # [-] Bit depth of the DN of the ISM
+
+        # Streaming: lines (ALT) of the blocks read, calibrated and written at a time (fused_calibration only).
+        # 0 to process the whole images (needed by the stage cache)
+        self.stream_lines = 0
 
         # Auxiliary inputs (relative paths to the root folder)
         #--------------------------------------------------------------------------------
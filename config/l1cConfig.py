@@ -23,4 +23,8 @@ class l1cConfig:
         # 4QFJ 12345 67890 .......precision level 1 m                                   -> MGSPrecision 5
         self.mgrs_tile_precision = 3 # [m]
 
+        # Resampling of the L1B pixels onto the L1C grid: 'nearest', 'linear' (Delaunay triangles)
+        # or 'cubic' (cubic convolution in the L1B grid)
+        self.resampling = 'linear'
+
         self.plotL1cGrid = True
@@ -0,0 +1,27 @@
+# MAIN FUNCTION TO CALL THE E2E CHAIN (ISM, L1B AND L1C)
+
+from e2e.src.e2e import e2e
+import argparse
+
+# Directory - this is the common directory for the execution of the E2E, all modules
+auxdir = r"C:\\Users\\alvaf\\OneDrive\\Desktop\\Carlos III\\TD\PROYECTO\\Proc_Datos_Tierra\\auxiliary"
+sgmdir = r"C:\\Users\\alvaf\\OneDrive\\Desktop\\Carlos III\\Cuatri III\\Proc_datos_espacio\\EODP_TER_2021\\EODP-TS-E2E\\sgm_out"
+gmdir = r"C:\\Users\\alvaf\\OneDrive\\Desktop\\Carlos III\\Cuatri III\\Proc_datos_espacio\\EODP_TER_2021\\EODP-TS-E2E\\gm_out"
+ismdir = r"C:\\Users\\alvaf\\OneDrive\\Desktop\\Carlos III\\Cuatri III\\Proc_datos_espacio\\EODP_TER_2021\\EODP-TS-E2E\\myoutput_ism"
+l1bdir = r"C:\\Users\\alvaf\\OneDrive\\Desktop\\Carlos III\\Cuatri III\\Proc_datos_espacio\\EODP_TER_2021\\EODP-TS-E2E\\myoutput_l1b"
+l1cdir = r"C:\\Users\\alvaf\\OneDrive\\Desktop\\Carlos III\\Cuatri III\\Proc_datos_espacio\\EODP_TER_2021\\EODP-TS-E2E\\myoutput_l1c"
+
+# Initialise the E2E chain
+# (guarded, the background plotting processes import this file on Windows)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='E2E chain: ISM, L1B and L1C in one process')
+    parser.add_argument('--resume', action='store_true',
+                        help='Reuse the outputs of the bands found in the stage cache')
+    parser.add_argument('--write-intermediate', action='store_true',
+                        help='Also write the outputs of the ISM and the L1B')
+    args = parser.parse_args()
+
+    myE2e = e2e(auxdir, sgmdir, gmdir, ismdir, l1bdir, l1cdir)
+    myE2e.globalConfig.resume = args.resume
+    myE2e.globalConfig.e2e_write_intermediate = args.write_intermediate
+    myE2e.processModule()
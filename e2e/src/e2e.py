@@ -0,0 +1,65 @@
+
+# END-TO-END CHAIN (ISM, L1B AND L1C IN ONE PROCESS)
+
+from ism.src.ism import ism
+from l1b.src.l1b import l1b
+from l1c.src.l1c import l1c
+
+class e2e:
+    """
+    Runs the ISM, the L1B and the L1C in one process. The output of every band is handed
+    over in memory from one module to the next, as soon as the ISM has produced it (from
+    the band workers of the ISM), instead of being written and read back. The outputs of
+    the ISM and the L1B are only written if globalConfig.e2e_write_intermediate
+    """
+
+    def __init__(self, auxdir, sgmdir, gmdir, ismdir, l1bdir, l1cdir):
+        """
+        :param auxdir: auxiliary directory
+        :param sgmdir: input directory of the ISM (SGM scene)
+        :param gmdir: input directory of the L1C (GM geolocation)
+        :param ismdir: output directory of the ISM
+        :param l1bdir: output directory of the L1B
+        :param l1cdir: output directory of the L1C
+        """
+        # Each module has its own context (directories, logger, configuration, writer)
+        self.myIsm = ism(auxdir, sgmdir, ismdir)
+        self.myL1b = l1b(auxdir, ismdir, l1bdir)
+        self.myL1c = l1c(auxdir, gmdir + ',' + l1bdir, l1cdir)
+
+        self.logger = self.myIsm.logger
+        self.globalConfig = self.myIsm.globalConfig
+
+    def processModule(self):
+
+        self.logger.info("Start of the E2E chain")
+        write = self.globalConfig.e2e_write_intermediate
+        for module in (self.myL1b, self.myL1c):
+            module.globalConfig.resume = self.globalConfig.resume
+            module.globalConfig.stage_cache = self.globalConfig.stage_cache
+
+        # Inputs of the L1B and L1C shared by all the bands, read once
+        self.myL1b.preload()
+        self.myL1c.geolocation()
+
+        try:
+            # ISM, with the L1B and the L1C of each band chained to its output
+            self.myIsm.processModule(consumer=self.processBand, write=write)
+        finally:
+            # Wait for the products of the L1B and the L1C still being written (also if a band failed)
+            for module in (self.myL1b, self.myL1c):
+                module.writer.flush(module.logger)
+                module.plotter.flush(module.logger)
+
+        self.logger.info("End of the E2E chain!")
+
+    def processBand(self, band, toa):
+        """
+        L1B and L1C of one band
+        :param band: band
+        :param toa: output TOA of the ISM [DN]
+        :return: NA
+        """
+        # The stage cache keys of each output are derived from the key of its input, not from the data
+        toa = self.myL1b.processBand(band, toa, self.globalConfig.e2e_write_intermediate, self.myIsm.stageKeys.get(band))
+        self.myL1c.processBand(band, toa, self.myL1b.stageKeys.get(band))
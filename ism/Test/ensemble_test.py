@@ -0,0 +1,46 @@
+from ism.src.ensemble import ensemble
+import numpy as np
+import os
+
+
+def check_percentiles(auxdir, outdir, band='VNIR-0', nreal=21, seed=5):
+    """
+    Checks the percentiles of a small ensemble against np.percentile over all its realizations
+    :param auxdir: auxiliary directory
+    :param outdir: output directory (of the statistics of the ensemble)
+    :param band: band
+    :param nreal: number of realizations
+    :param seed: seed of the synthetic optical image
+    :return: True if all the percentiles are equal
+    """
+    myEns = ensemble(auxdir, outdir, outdir)
+    cfg = myEns.ismConfig
+    cfg.ensemble_size = nreal
+    cfg.ensemble_hist_bins = 4096  # 1 DN wide bins, exact percentiles
+    cfg.ensemble_chunk_bytes = 1   # one realization per batch, to exercise the merge of the batches
+
+    toa = np.random.default_rng(seed).random((50, 40)) * 30 + 1
+    results = myEns.compute(toa, band)
+    myEns.writer.flush(myEns.logger)
+
+    # All the realizations at once, with the same chains
+    rngs = myEns.realizationRngs(band, nreal)
+    chains = [myEns.myRad.compileChain(band, myEns.detector.maps(band, toa.shape[1], rng)) for rng in rngs]
+    toa_e = np.minimum(toa * chains[0]['e_gain'], cfg.FWC)
+    alldn = next(myEns.batches(toa_e, chains, nreal))
+
+    ok = True
+    for pct in cfg.ensemble_percentiles:
+        ref = np.percentile(alldn, pct, axis=0, method='inverted_cdf')
+        diff = np.max(np.abs(ref - results['p' + str(pct)]))
+        print(f"p{pct}: max difference with np.percentile {diff:.1f} [DN]")
+        ok = ok and diff == 0
+    print(f"Mean: max difference {np.max(np.abs(alldn.mean(axis=0) - results['mean'])):.2e} [DN]")
+    print(f"VALIDATION: {'PASSED' if ok else 'FAILED'}")
+    return ok
+
+
+if __name__ == "__main__":
+    base_dir = r'C:\Users\alvaf\OneDrive\Desktop\Carlos III\Cuatri III\Proc_datos_espacio\EODP_TER_2021\EODP-TS-ISM'
+    auxdir = r'C:\Users\alvaf\OneDrive\Desktop\Carlos III\TD\PROYECTO\Proc_Datos_Tierra\auxiliary'
+    check_percentiles(auxdir, os.path.join(base_dir, 'myoutput_ensemble'))
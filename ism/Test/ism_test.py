@@ -31,8 +31,8 @@ class CompareToaISM:
             raise ValueError(f"Tipo de archivo no válido: {file_type}")
 
         # Leer archivos
-        toa_ref = readToa(self.output_dir, filename)
-        toa_my = readToa(self.myoutput_dir, filename)
+        toa_ref = readToa(self.output_dir, filename).astype(np.float64) # DN are stored as uint16
+        toa_my = readToa(self.myoutput_dir, filename).astype(np.float64)
 
         # Convertir a arrays 1D
         ref_flat = toa_ref.flatten()
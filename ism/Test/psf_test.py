@@ -0,0 +1,48 @@
+from ism.src.opticalPhase import opticalPhase
+from ism.src.mtf import mtf
+from common.src.auxFunc import getIndexBand
+import numpy as np
+import os
+
+
+def compare_psf_mtf(auxdir, outdir, band='VNIR-0', shape=(100, 150), half_widths=(1, 2, 3, 5, 8, 12, 1000)):
+    """
+    Compares the PSF convolution (do_psf_conv) with the application of the MTF, on synthetic
+    scenes, for several half-widths of the kernel. The full kernel (half-width of half the
+    image) must give the same result as the MTF
+    :param auxdir: auxiliary directory
+    :param outdir: output directory
+    :param band: band (of the MTF)
+    :param shape: size of the scenes (ALT, ACT)
+    :param half_widths: half-widths of the kernel [pixels]
+    :return: True if the full kernel reproduces the MTF
+    """
+    myOpt = opticalPhase(auxdir, outdir, outdir)
+    cfg = myOpt.ismConfig
+    myMtf = mtf(myOpt.logger, outdir, None, None, cfg)
+    Hsys = myMtf.system_mtf(shape[0], shape[1], cfg.D, cfg.wv[getIndexBand(band)], cfg.f, cfg.pix_size,
+                            cfg.kLF, cfg.wLF, cfg.kHF, cfg.wHF, cfg.defocus, cfg.ksmear, cfg.kmotion, outdir, band)
+
+    alt, act = np.mgrid[:shape[0], :shape[1]]
+    scenes = {'smooth': np.sin(2 * np.pi * act / shape[1]) * np.cos(4 * np.pi * alt / shape[0]) + 2,
+              'random': np.random.default_rng(1).random(shape)}
+
+    ok = True
+    for name, toa in scenes.items():
+        ref = myOpt.applySysMtf(toa, Hsys)
+        contrast = np.max(np.abs(ref - ref.mean()))
+        print(f"\n--- Scene {name} {shape}, psf_separable_tol {cfg.psf_separable_tol} ---")
+        for hw in half_widths:
+            toa_psf = myOpt.applyPsfConv(toa, myOpt.psfKernel(Hsys, hw))
+            err = np.max(np.abs(toa_psf - ref)) / contrast
+            print(f"Half-width {hw}: max error relative to the contrast {err:.2e}")
+        ok = ok and err < 1e-5
+    print(f"\nVALIDATION (full kernel): {'PASSED' if ok else 'FAILED'}")
+    return ok
+
+
+if __name__ == "__main__":
+    base_dir = r'C:\Users\alvaf\OneDrive\Desktop\Carlos III\Cuatri III\Proc_datos_espacio\EODP_TER_2021\EODP-TS-ISM'
+    auxdir = r'C:\Users\alvaf\OneDrive\Desktop\Carlos III\TD\PROYECTO\Proc_Datos_Tierra\auxiliary'
+    compare_psf_mtf(auxdir, os.path.join(base_dir, 'myoutput_psf'))
+    compare_psf_mtf(auxdir, os.path.join(base_dir, 'myoutput_psf'), shape=(101, 151))
@@ -0,0 +1,11 @@
+
+# MAIN FUNCTION TO REWRITE AN SGM CUBE WITH A CHUNKING SUITED TO BAND-WISE READS
+
+from common.io.readCube import ingestCube
+
+# Directories - input SGM folder and output folder for the re-chunked cube
+indir = r"C:\\Users\\alvaf\\OneDrive\\Desktop\\Carlos III\\Cuatri III\\Proc_datos_espacio\\EODP_TER_2021\\EODP-TS-E2E\\sgm_out"
+outdir = r"C:\\Users\\alvaf\\OneDrive\\Desktop\\Carlos III\\Cuatri III\\Proc_datos_espacio\\EODP_TER_2021\\EODP-TS-E2E\\sgm_out_chunked"
+
+# Rewrite the cube, same name so that the ISM can read it from outdir
+ingestCube(indir, 'sgm_toa.nc', outdir, 'sgm_toa')
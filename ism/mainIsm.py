@@ -2,6 +2,7 @@
 # MAIN FUNCTION TO CALL THE ISM MODULE
 
 from ism.src.ism import ism
+import argparse
 
 # Directory - this is the common directory for the execution of the E2E, all modules
 auxdir = r"C:\\Users\\alvaf\\OneDrive\\Desktop\\Carlos III\\TD\PROYECTO\\Proc_Datos_Tierra\\auxiliary"
@@ -12,5 +13,13 @@ outdir = r"C:\\Users\\alvaf\\OneDrive\\Desktop\\Carlos III\\Cuatri III\\Proc_dat
 #outdir = r"C:\\Users\\alvaf\\OneDrive\\Desktop\\Carlos III\\Cuatri III\\Proc_datos_espacio\\EODP_TER_2021\\EODP-TS-ISM\\myoutput"
 
 # Initialise the ISM
-myIsm = ism(auxdir, indir, outdir)
-myIsm.processModule()
+# (guarded, the background plotting processes import this file on Windows)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Instrument module')
+    parser.add_argument('--resume', action='store_true',
+                        help='Reuse the outputs of the bands found in the stage cache')
+    args = parser.parse_args()
+
+    myIsm = ism(auxdir, indir, outdir)
+    myIsm.globalConfig.resume = args.resume
+    myIsm.processModule()
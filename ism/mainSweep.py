@@ -0,0 +1,19 @@
+
+# MAIN FUNCTION TO RUN A PARAMETER SWEEP OF THE ISM
+
+from ism.src.sweep import sweep
+
+# Directory - this is the common directory for the execution of the E2E, all modules
+auxdir = r"C:\\Users\\alvaf\\OneDrive\\Desktop\\Carlos III\\TD\PROYECTO\\Proc_Datos_Tierra\\auxiliary"
+indir = r"C:\\Users\\alvaf\\OneDrive\\Desktop\\Carlos III\\Cuatri III\\Proc_datos_espacio\\EODP_TER_2021\\EODP-TS-E2E\\sgm_out"
+outdir = r"C:\\Users\\alvaf\\OneDrive\\Desktop\\Carlos III\\Cuatri III\\Proc_datos_espacio\\EODP_TER_2021\\EODP-TS-E2E\\myoutput_sweep"
+
+# Designs (ORIGINAL and NUEVO of ismConfig), each with several detector settings
+designs = [{'pix_size': 30e-6, 't_int': 0.00672, 'D': 0.150, 'f': 0.5262},
+           {'pix_size': 42e-6, 't_int': 0.0428, 'D': 0.07565, 'f': 0.2345}]
+grid = [dict(design, kprnu=kprnu, T=T) for design in designs for kprnu in [0.02, 0.04] for T in [280.0, 300.0]]
+
+# (guarded, the background plotting processes import this file on Windows)
+if __name__ == '__main__':
+    mySweep = sweep(auxdir, indir, outdir)
+    mySweep.run(grid)
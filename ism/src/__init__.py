@@ -1,6 +1,10 @@
 from .detectionPhase import *
+from .detectorModel import *
+from .ensemble import *
 from .initIsm import *
 from .ism import *
 from .mtf import *
 from .opticalPhase import *
+from .radiometricChain import *
+from .sweep import *
 from .videoChainPhase import *
\ No newline at end of file
@@ -1,5 +1,6 @@
 
 from ism.src.initIsm import initIsm
+from ism.src.detectorModel import detectorModel
 import numpy as np
 from common.io.writeToa import writeToa
 from common.plot.plotMat2D import plotMat2D
@@ -7,17 +8,17 @@ from common.plot.plotF import plotF
 
 class detectionPhase(initIsm):
 
-    def __init__(self, auxdir, indir, outdir):
-        super().__init__(auxdir, indir, outdir)
-
-        # Initialise the random see for the PRNU and DSNU
-        np.random.seed(self.ismConfig.seed)
-
+    def __init__(self, auxdir, indir, outdir, context=None):
+        super().__init__(auxdir, indir, outdir, context)
+        self.detector = detectorModel(self.auxdir, self.indir, self.outdir, self.context)
 
     def compute(self, toa, band):
 
         self.logger.info("EODP-ALG-ISM-2000: Detection stage")
 
+        # Calibration maps of the detector of the band (PRNU, DSNU, bad/dead pixels)
+        det = self.detector.maps(band, toa.shape[1])
+
         # Irradiance to photons conversion
         # -------------------------------------------------------------------------------
         self.logger.info("EODP-ALG-ISM-2010: Irradiances to Photons")
@@ -35,34 +36,34 @@ class detectionPhase(initIsm):
 
         if self.ismConfig.save_after_ph2e:
             saveas_str = self.globalConfig.ism_toa_e + band
-            writeToa(self.outdir, saveas_str, toa)
+            self.writer.submit(writeToa, self.outdir, saveas_str, toa)
 
         # PRNU
         # -------------------------------------------------------------------------------
         if self.ismConfig.apply_prnu:
 
             self.logger.info("EODP-ALG-ISM-2020: PRNU")
-            toa = self.prnu(toa, self.ismConfig.kprnu)
+            toa = self.prnu(toa, det['prnu'])
 
             self.logger.debug("TOA [0,0] " +str(toa[0,0]) + " [e-]")
 
             if self.ismConfig.save_after_prnu:
                 saveas_str = self.globalConfig.ism_toa_prnu + band
-                writeToa(self.outdir, saveas_str, toa)
+                self.writer.submit(writeToa, self.outdir, saveas_str, toa)
 
         # Dark-signal
         # -------------------------------------------------------------------------------
         if self.ismConfig.apply_dark_signal:
 
             self.logger.info("EODP-ALG-ISM-2020: Dark signal")
-            toa = self.darkSignal(toa, self.ismConfig.kdsnu, self.ismConfig.T, self.ismConfig.Tref,
+            toa = self.darkSignal(toa, det['dsnu'], self.ismConfig.T, self.ismConfig.Tref,
                                   self.ismConfig.ds_A_coeff, self.ismConfig.ds_B_coeff)
 
             self.logger.debug("TOA [0,0] " +str(toa[0,0]) + " [e-]")
 
             if self.ismConfig.save_after_ds:
                 saveas_str = self.globalConfig.ism_toa_ds + band
-                writeToa(self.outdir, saveas_str, toa)
+                self.writer.submit(writeToa, self.outdir, saveas_str, toa)
 
         # Bad/dead pixels
         # -------------------------------------------------------------------------------
@@ -70,8 +71,8 @@ class detectionPhase(initIsm):
 
             self.logger.info("EODP-ALG-ISM-2050: Bad/dead pixels")
             toa = self.badDeadPixels(toa,
-                               self.ismConfig.bad_pix,
-                               self.ismConfig.dead_pix,
+                               det['bad'],
+                               det['dead'],
                                self.ismConfig.bad_pix_red,
                                self.ismConfig.dead_pix_red)
 
@@ -81,16 +82,16 @@ class detectionPhase(initIsm):
         if self.ismConfig.save_detection_stage:
             saveas_str = self.globalConfig.ism_toa_detection + band
 
-            writeToa(self.outdir, saveas_str, toa)
+            self.writer.submit(writeToa, self.outdir, saveas_str, toa)
 
             title_str = 'TOA after the detection phase [e-]'
             xlabel_str='ACT'
             ylabel_str='ALT'
-            plotMat2D(toa, title_str, xlabel_str, ylabel_str, self.outdir, saveas_str)
+            self.plotter.submit(plotMat2D, toa, title_str, xlabel_str, ylabel_str, self.outdir, saveas_str)
 
             idalt = int(toa.shape[0]/2)
             saveas_str = saveas_str + '_alt' + str(idalt)
-            plotF([], toa[idalt,:], title_str, xlabel_str, ylabel_str, self.outdir, saveas_str)
+            self.plotter.submit(plotF, [], toa[idalt,:], title_str, xlabel_str, ylabel_str, self.outdir, saveas_str)
 
         return toa
 
@@ -127,39 +128,39 @@ class detectionPhase(initIsm):
         print(f'Percentage of saturated pixels = {(100 * np.sum(toae == self.ismConfig.FWC)) / toae.size}')
         return toae
 
-    def badDeadPixels(self, toa,bad_pix,dead_pix,bad_pix_red,dead_pix_red):
+    def badDeadPixels(self, toa,idx_bad,idx_dead,bad_pix_red,dead_pix_red):
         """
         Bad and dead pixels simulation
         :param toa: input toa in [e-]
-        :param bad_pix: Percentage of bad pixels in the CCD [%]
-        :param dead_pix: Percentage of dead pixels in the CCD [%]
+        :param idx_bad: Columns of the bad pixels (see detectorModel)
+        :param idx_dead: Columns of the dead pixels
         :param bad_pix_red: Reduction in the quantum efficiency for the bad pixels [-, over 1]
         :param dead_pix_red: Reduction in the quantum efficiency for the dead pixels [-, over 1]
         :return: toa in e- including bad & dead pixels
         """
         #TODO
-        toa[:, 5] = toa[:, 5] * (1 - bad_pix_red)
+        toa[:, idx_bad] *= (1 - bad_pix_red)
+        toa[:, idx_dead] *= (1 - dead_pix_red)
         return toa
 
-    def prnu(self, toa, kprnu):
+    def prnu(self, toa, prnu):
         """
         Adding the PRNU effect
         :param toa: TOA pre-PRNU [e-]
-        :param kprnu: multiplicative factor to the standard normal deviation for the PRNU
+        :param prnu: PRNU map, per column [-] (see detectorModel)
         :return: TOA after adding PRNU [e-]
         """
         #TODO
-        prnu =  np.random.normal(0, 1, toa.shape[1])  * kprnu
         toa = toa * (1+prnu)
 
         return toa
 
 
-    def darkSignal(self, toa, kdsnu, T, Tref, ds_A_coeff, ds_B_coeff):
+    def darkSignal(self, toa, dsnu, T, Tref, ds_A_coeff, ds_B_coeff):
         """
         Dark signal simulation
         :param toa: TOA in [e-]
-        :param kdsnu: multiplicative factor to the standard normal deviation for the DSNU
+        :param dsnu: DSNU map, per column [-] (see detectorModel)
         :param T: Temperature of the system
         :param Tref: Reference temperature of the system
         :param ds_A_coeff: Empirical parameter of the model 7.87 e-
@@ -167,7 +168,6 @@ class detectionPhase(initIsm):
         :return: TOA in [e-] with dark signal
         """
         # TODO
-        dsnu= np.abs( np.random.normal(0, 1, toa.shape[1]) )*kdsnu
         sd=ds_A_coeff*(T/Tref)**3*np.exp(-ds_B_coeff*(1/T-1/Tref))
         ds=sd*(1+dsnu)
         toa=toa+ds
@@ -0,0 +1,67 @@
+
+from ism.src.initIsm import initIsm
+from common.src.arrayCache import hashKey
+import numpy as np
+
+class detectorModel(initIsm):
+    """
+    Calibration maps of the detector of a band: PRNU and DSNU per column, and the
+    columns of the bad and dead pixels. They are generated once from the configuration
+    and the seed, and kept in the 'detector' cache (.npz), so the same detector is
+    reused for every scene
+    """
+
+    def __init__(self, auxdir, indir, outdir, context=None):
+        super().__init__(auxdir, indir, outdir, context)
+        self.cache = self.getCache('detector')
+
+    def maps(self, band, ncolumns, rng=None):
+        """
+        Calibration maps of a band
+        :param band: band
+        :param ncolumns: number of columns (ACT) of the detector
+        :param rng: optional random generator. If given, a new detector is drawn from it
+                    (not cached). By default, the detector of the band (seed of the configuration)
+        :return: dictionary with 'prnu' and 'dsnu' [-] per column, and the indices of the
+                 'bad' and 'dead' columns
+        """
+        if rng is not None:
+            return self.generate(ncolumns, rng)
+
+        cfg = self.ismConfig
+        # (revision 2: bad and dead columns exclusive in the regular layout)
+        key = hashKey('detector', 2, cfg.seed, self.globalConfig.bands, band, ncolumns, cfg.kprnu, cfg.kdsnu,
+                      cfg.bad_pix, cfg.dead_pix, cfg.bad_dead_layout)
+        det = self.cache.get(key)
+        if det is None:
+            self.logger.debug("Generating the detector maps of " + band)
+            det = self.cache.put(key, self.generate(ncolumns, self.bandRng(band)))
+        return det
+
+    def generate(self, ncolumns, rng):
+        """
+        Draws the calibration maps of a detector
+        :param ncolumns: number of columns
+        :param rng: random generator
+        :return: dictionary of maps (see maps)
+        """
+        cfg = self.ismConfig
+        prnu = rng.normal(0, 1, ncolumns) * cfg.kprnu
+        dsnu = np.abs(rng.normal(0, 1, ncolumns)) * cfg.kdsnu
+
+        nbad = int(ncolumns * cfg.bad_pix / 100)
+        ndead = int(ncolumns * cfg.dead_pix / 100)
+        if cfg.bad_dead_layout == 'regular':
+            # Evenly spaced, the bad pixels from column 5 and the dead ones from column 0
+            bad = np.arange(5, ncolumns, ncolumns // nbad) if nbad > 0 else np.zeros(0, dtype=int)
+            dead = np.arange(0, ncolumns, ncolumns // ndead) if ndead > 0 else np.zeros(0, dtype=int)
+            # A column is either bad or dead, not both (reduced once)
+            bad = np.setdiff1d(bad, dead)
+        elif cfg.bad_dead_layout == 'random':
+            idx = rng.choice(ncolumns, min(nbad + ndead, ncolumns), replace=False)
+            bad = np.sort(idx[:nbad])
+            dead = np.sort(idx[nbad:])
+        else:
+            raise Exception('Unknown bad/dead pixel layout ' + str(cfg.bad_dead_layout))
+
+        return {'prnu': prnu, 'dsnu': dsnu, 'bad': bad.astype(np.int32), 'dead': dead.astype(np.int32)}
@@ -0,0 +1,166 @@
+
+from ism.src.initIsm import initIsm
+from ism.src.detectorModel import detectorModel
+from ism.src.radiometricChain import radiometricChain
+from common.io.writeToa import writeToa
+import numpy as np
+
+class ensemble(initIsm):
+    """
+    Monte Carlo ensemble of the detection and video chain phases. The optical output of a
+    band is computed once, and the PRNU/DSNU realizations are run in batches of
+    (realizations, ALT, ACT), with the compiled radiometric chain of each realization.
+    Only the per-pixel statistics of the DN are kept (streamed over the batches):
+    mean, standard deviation and percentiles (from a histogram per pixel, in a
+    second pass over the realizations).
+    The realizations always use the compiled chain, whatever fused_radiometry and
+    compiled_radiometry say: it is what allows the batches. Its rounding can differ
+    by 1 DN from the stepwise chain on rounding boundaries (see radiometricChain.compileChain)
+    """
+
+    def __init__(self, auxdir, indir, outdir, context=None):
+        super().__init__(auxdir, indir, outdir, context)
+        self.detector = detectorModel(self.auxdir, self.indir, self.outdir, self.context)
+        self.myRad = radiometricChain(self.auxdir, self.indir, self.outdir, self.context)
+
+    def compute(self, toa, band):
+        """
+        Runs the ensemble of a band and writes its statistics
+        :param toa: TOA image after the optical phase in irradiances [mW/m2] (not modified)
+        :param band: band
+        :return: dictionary with the 'mean', 'std' and the percentiles ('p' + percentile) [DN]
+        """
+        cfg = self.ismConfig
+        nreal = cfg.ensemble_size
+        self.logger.info("EODP-ALG-ISM-2000: Detection stage and video chain, ensemble of " + str(nreal) + " realizations")
+
+        # Electrons, the same for all the realizations (saturated at the FWC)
+        rngs = self.realizationRngs(band, nreal)
+        chains = [self.myRad.compileChain(band, self.detector.maps(band, toa.shape[1], rng)) for rng in rngs]
+        toa_e = np.minimum(np.asarray(toa, dtype=np.float64) * chains[0]['e_gain'], cfg.FWC)
+
+        # Two passes over the batches of realizations (regenerated, not stored):
+        # the moments and range of every pixel, then the histogram within that range.
+        # Each batch holds two float64 arrays of its size: the DN and their deviations from the mean
+        batch = max(1, cfg.ensemble_chunk_bytes // (2 * 8 * toa_e.size))
+        stats = None
+        for toa_dn in self.batches(toa_e, chains, batch):
+            stats = self.accumulate(stats, toa_dn)
+        self.initHistogram(stats, cfg.ensemble_hist_bins)
+        for toa_dn in self.batches(toa_e, chains, batch):
+            self.accumulateHistogram(stats, toa_dn)
+
+        results = self.finalize(stats, cfg.ensemble_percentiles)
+
+        # Write the statistics
+        self.writer.submit(writeToa, self.outdir, self.globalConfig.ism_toa_ens_mean + band, results['mean'])
+        self.writer.submit(writeToa, self.outdir, self.globalConfig.ism_toa_ens_std + band, results['std'])
+        for pct in cfg.ensemble_percentiles:
+            self.writer.submit(writeToa, self.outdir, self.globalConfig.ism_toa_ens_pct + str(pct) + '_' + band,
+                               results['p' + str(pct)])
+        return results
+
+    def realizationRngs(self, band, nreal):
+        """
+        Random generators of the realizations of a band, spawned from the stream of the band
+        :param band: band
+        :param nreal: number of realizations
+        :return: list of numpy random Generators
+        """
+        return [np.random.default_rng(seed) for seed in self.bandSeed(band).spawn(nreal)]
+
+    def batches(self, toa_e, chains, batch):
+        """
+        Realizations of the DN, by batches
+        :param toa_e: TOA in electrons [e-]
+        :param chains: compiled radiometric chains of the realizations
+        :param batch: realizations per batch
+        :return: generator of arrays (realizations, ALT, ACT) [DN]
+        """
+        for ireal in range(0, len(chains), batch):
+            gain = np.stack([chain['gain'] for chain in chains[ireal:ireal+batch]])[:, np.newaxis, :]
+            offset = np.stack([chain['offset'] for chain in chains[ireal:ireal+batch]])[:, np.newaxis, :]
+
+            toa_dn = toa_e * gain
+            toa_dn += offset
+            np.round(toa_dn, out=toa_dn)
+            np.clip(toa_dn, 0, chains[0]['dn_max'], out=toa_dn)
+            yield toa_dn
+
+    def accumulate(self, stats, toa_dn):
+        """
+        Merges a batch of realizations into the running statistics: count, mean and
+        sum of squared deviations (Chan et al. pairwise update), minimum and maximum
+        :param stats: running statistics (None for the first batch)
+        :param toa_dn: batch of realizations (realizations, ALT, ACT) [DN]
+        :return: updated statistics
+        """
+        nbatch = toa_dn.shape[0]
+        mean_b = toa_dn.mean(axis=0)
+        dev = toa_dn - mean_b
+        dev *= dev
+        m2_b = dev.sum(axis=0)
+        del dev
+
+        if stats is None:
+            stats = {'count': 0, 'mean': np.zeros_like(mean_b), 'm2': np.zeros_like(mean_b),
+                     'min': toa_dn.min(axis=0), 'max': toa_dn.max(axis=0)}
+
+        count = stats['count'] + nbatch
+        delta = mean_b - stats['mean']
+        stats['mean'] += delta * nbatch / count
+        stats['m2'] += m2_b + delta**2 * stats['count'] * nbatch / count
+        stats['count'] = count
+        np.minimum(stats['min'], toa_dn.min(axis=0), out=stats['min'])
+        np.maximum(stats['max'], toa_dn.max(axis=0), out=stats['max'])
+        return stats
+
+    def initHistogram(self, stats, nbins):
+        """
+        Bins of the histogram of every pixel, covering its range of DN with integer bins.
+        If the range fits in the bins, they are 1 DN wide and the percentiles are exact
+        :param stats: statistics of the first pass (see accumulate)
+        :param nbins: number of bins
+        :return: NA
+        """
+        span = stats['max'] - stats['min'] + 1
+        stats['width'] = np.ceil(span / nbins)
+        dtype = np.uint16 if stats['count'] < 2**16 else np.uint32
+        stats['hist'] = np.zeros((nbins,) + span.shape, dtype=dtype)
+
+    def accumulateHistogram(self, stats, toa_dn):
+        """
+        Adds a batch of realizations to the histogram of every pixel, in place and one
+        realization at a time (every pixel is then in a single bin, so the increments
+        do not collide), with temporaries of the size of one image
+        :param stats: statistics (see initHistogram)
+        :param toa_dn: batch of realizations (realizations, ALT, ACT) [DN]
+        :return: NA
+        """
+        hist = stats['hist'].reshape(stats['hist'].shape[0], -1)
+        pix = np.arange(hist.shape[1])
+        for real in toa_dn:
+            ibin = ((real - stats['min']) // stats['width']).astype(np.intp).ravel()
+            hist[ibin, pix] += 1
+
+    def finalize(self, stats, percentiles):
+        """
+        Statistics of the ensemble
+        :param stats: running statistics (see accumulate)
+        :param percentiles: percentiles to compute [%]
+        :return: dictionary with the 'mean', 'std' and the percentiles ('p' + percentile) [DN]
+        """
+        count = stats['count']
+        results = {'mean': stats['mean'],
+                   'std': np.sqrt(stats['m2'] / max(count - 1, 1))}
+
+        # Percentiles (lowest value reaching the rank), interpolated within the bin if wider than 1 DN
+        cum = np.cumsum(stats['hist'], axis=0)
+        for pct in percentiles:
+            rank = max(1, int(np.ceil(pct / 100 * count)))
+            ibin = np.argmax(cum >= rank, axis=0)
+            inbin = np.take_along_axis(stats['hist'], ibin[np.newaxis], axis=0)[0]
+            before = np.take_along_axis(cum, ibin[np.newaxis], axis=0)[0] - inbin
+            offset = np.floor((rank - before - 1) / np.maximum(inbin, 1) * stats['width'])
+            results['p' + str(pct)] = stats['min'] + ibin * stats['width'] + offset
+        return results
@@ -1,15 +1,37 @@
 from config.ismConfig import ismConfig
 from common.src.baseModule import baseModule
+import numpy as np
 
 class initIsm(baseModule):
 
-    def __init__(self, auxdir, indir, outdir):
+    def __init__(self, auxdir, indir, outdir, context=None):
 
         # Initialise baseModule (the log, etc.)
-        super().__init__(auxdir, indir, outdir, "ISM")
+        super().__init__(auxdir, indir, outdir, "ISM", context)
 
-        # Init Local config
-        self.ismConfig = ismConfig()
+        # Init Local config, shared by all the stages of the run
+        if self.context.ismConfig is None:
+            self.context.ismConfig = ismConfig()
+        self.ismConfig = self.context.ismConfig
 
         # Make sure the logger is enabled
         self.logger.disabled = False
+
+    def bandSeed(self, band):
+        """
+        Seed sequence of a band. Each band has its own stream, spawned from
+        the seed of the configuration, so the draws do not depend on the order
+        (or the parallelism) in which the bands are processed
+        :param band: band
+        :return: numpy SeedSequence
+        """
+        seeds = np.random.SeedSequence(self.ismConfig.seed).spawn(len(self.globalConfig.bands))
+        return seeds[self.globalConfig.bands.index(band)]
+
+    def bandRng(self, band):
+        """
+        Random generator of a band (see bandSeed)
+        :param band: band
+        :return: numpy random Generator
+        """
+        return np.random.default_rng(self.bandSeed(band))
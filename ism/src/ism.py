@@ -5,47 +5,184 @@ from ism.src.initIsm import initIsm
 from ism.src.opticalPhase import opticalPhase
 from ism.src.detectionPhase import detectionPhase
 from ism.src.videoChainPhase import videoChainPhase
-from common.io.readCube import readCube
+from ism.src.radiometricChain import radiometricChain
+from ism.src.ensemble import ensemble
+from common.io.readCube import readCube, readCubeWv
 from common.io.writeToa import writeToa
+from common.src.arrayCache import hashKey, hashFile, fileKey, configKey
+from concurrent.futures import ThreadPoolExecutor
+import os
 
 class ism(initIsm):
 
-    def __init__(self, auxdir, indir, outdir):
-        super().__init__(auxdir, indir, outdir)
-
-    def processModule(self):
+    def __init__(self, auxdir, indir, outdir, context=None):
+        super().__init__(auxdir, indir, outdir, context)
+
+        # Stages of the ISM, sharing the context of the run
+        self.myOpt = opticalPhase(self.auxdir, self.indir, self.outdir, self.context)
+        self.myDet = detectionPhase(self.auxdir, self.indir, self.outdir, self.context)
+        self.myVcu = videoChainPhase(self.auxdir, self.indir, self.outdir, self.context)
+        self.myRad = radiometricChain(self.auxdir, self.indir, self.outdir, self.context)
+        self.myEns = ensemble(self.auxdir, self.indir, self.outdir, self.context)
+
+        # Keys of the band outputs in the stage cache
+        self.stageKeys = {}
+
+    def processModule(self, consumer=None, write=True):
+        """
+        Runs the ISM over all the bands
+        :param consumer: optional function consumer(band, toa) called with the output TOA [DN]
+                         of every band, as soon as it is ready (from the band workers)
+        :param write: whether the output TOA are written (the intermediate outputs are
+                      controlled by the save_* flags of ismConfig)
+        :return: NA
+        """
 
         self.logger.info("Start of the Instrument Module")
 
-        # Read input TOA cube
-        # -------------------------------------------------------------------------------
-        sgm_toa, sgm_wv = readCube(self.indir, self.globalConfig.scene)
+        try:
+            # Bands already processed in a previous run (resume mode)
+            # -------------------------------------------------------------------------------
+            bands = self.resumeBands(self.globalConfig.bands, consumer, write)
 
-        for band in self.globalConfig.bands:
+            # Read input TOA cube
+            # -------------------------------------------------------------------------------
+            # Either the whole cube, or only the wavelength window of the ISRF of the bands
+            # (of all of them in multi-band mode, of each band otherwise)
+            toa_isrf = {}
+            if bands and self.ismConfig.multiband_isrf:
+                if self.ismConfig.read_wv_window:
+                    sgm_toa, sgm_wv = self.readCubeWindow(bands)
+                else:
+                    sgm_toa, sgm_wv = readCube(self.indir, self.globalConfig.scene)
+
+                # Spectral integration of all the bands in one pass over the cube
+                toa_isrf = self.myOpt.spectralIntegrationBands(sgm_toa, sgm_wv, bands)
+                sgm_toa = None # The cube is no longer needed
+            elif bands and not self.ismConfig.read_wv_window:
+                sgm_toa, sgm_wv = readCube(self.indir, self.globalConfig.scene)
+
+            # Process the bands, independent of each other, in parallel
+            # -------------------------------------------------------------------------------
+            def runBand(band):
+                if self.ismConfig.read_wv_window and not self.ismConfig.multiband_isrf:
+                    band_toa, band_wv = self.readCubeWindow([band])
+                else:
+                    band_toa, band_wv = sgm_toa, sgm_wv
+                toa = self.processBand(band, band_toa, band_wv, toa_isrf.pop(band, None), write)
+                if consumer is not None:
+                    consumer(band, toa)
+
+            if self.ismConfig.band_workers > 1:
+                with ThreadPoolExecutor(self.ismConfig.band_workers) as executor:
+                    for result in [executor.submit(runBand, band) for band in bands]:
+                        result.result()
+            else:
+                for band in bands:
+                    runBand(band)
+        finally:
+            # Wait for the products still being written, and the plots still being rendered
+            # (also if a band failed)
+            self.writer.flush(self.logger)
+            self.plotter.flush(self.logger)
 
-            self.logger.info("Start of BAND " + band)
+        self.logger.info("End of the Instrument Module!")
 
-            # Optical Phase
-            # -------------------------------------------------------------------------------
-            myOpt = opticalPhase(self.auxdir, self.indir, self.outdir)
-            toa = myOpt.compute(sgm_toa, sgm_wv, band)
+    def processBand(self, band, sgm_toa, sgm_wv, toa_isrf=None, write=True):
+        """
+        Processing of one band: optical, detection and video chain phases
+        :param band: band
+        :param sgm_toa: SGM TOA cube (None if toa_isrf is given)
+        :param sgm_wv: wavelengths of the SGM cube
+        :param toa_isrf: optional TOA of the band already integrated with the ISRF
+        :param write: whether the output TOA is written
+        :return: output TOA [DN]
+        """
+        self.logger.info("Start of BAND " + band)
+
+        # Optical Phase
+        # -------------------------------------------------------------------------------
+        toa = self.myOpt.compute(sgm_toa, sgm_wv, band, toa_isrf)
 
+        # Ensemble of realizations of the detection and video chain (statistics only)
+        # -------------------------------------------------------------------------------
+        if self.ismConfig.ensemble_size > 0:
+            self.myEns.compute(toa, band)
+
+        if self.ismConfig.fused_radiometry:
+            # Detection Stage and Video Chain Phase, fused and in place
+            # -------------------------------------------------------------------------------
+            toa = self.myRad.compute(toa, band)
+        else:
             # Detection Stage
             # -------------------------------------------------------------------------------
-            myDet = detectionPhase(self.auxdir, self.indir, self.outdir)
-            toa = myDet.compute(toa, band)
+            toa = self.myDet.compute(toa, band)
 
             # Video Chain Phase
             # -------------------------------------------------------------------------------
-            myVcu = videoChainPhase(self.auxdir, self.indir, self.outdir)
-            toa = myVcu.compute(toa, band)
-
-            # Write output TOA
-            # -------------------------------------------------------------------------------
-            writeToa(self.outdir, self.globalConfig.ism_toa + band, toa)
-
-            self.logger.info("End of BAND " + band)
+            toa = self.myVcu.compute(toa, band)
 
-        self.logger.info("End of the Instrument Module!")
+        # Write output TOA
+        # -------------------------------------------------------------------------------
+        if write:
+            self.writer.submit(writeToa, self.outdir, self.globalConfig.ism_toa + band, toa,
+                               self.globalConfig.toa_compression, self.globalConfig.toa_complevel)
+
+        # Keep it for the next runs
+        if band in self.stageKeys:
+            self.context.getStageCache().put(self.stageKeys[band], toa)
+
+        self.logger.info("End of BAND " + band)
+        return toa
+
+    def resumeBands(self, bands, consumer=None, write=True):
+        """
+        Computes the stage cache keys of the bands and, in resume mode, writes the
+        outputs of the bands found in the cache
+        :param bands: list of bands
+        :param consumer: optional function consumer(band, toa), called with the outputs found in the cache
+        :param write: whether the outputs found in the cache are written
+        :return: list of the bands still to be processed
+        """
+        stages = self.context.getStageCache()
+        if stages is None:
+            return bands
+
+        # Inputs of the ISM: the SGM cube (its metadata, the cube is too large to be hashed),
+        # the ISRF of the band, and the configuration.
+        # Settings that only change the scheduling of the processing are not part of the key
+        scenekey = fileKey(os.path.join(self.indir, self.globalConfig.scene))
+        confkey = configKey(self.ismConfig, ('band_workers', 'fft_workers', 'psf_tile_lines', 'fused_block_bytes'))
+        for band in bands:
+            isrffile = self.auxdir + '/' + self.ismConfig.isrffile + band + '.nc'
+            self.stageKeys[band] = hashKey('ism', scenekey, confkey, self.globalConfig.bands, band, hashFile(isrffile))
+
+        if not self.globalConfig.resume:
+            return bands
+
+        pending = []
+        for band in bands:
+            toa = stages.get(self.stageKeys[band])
+            if toa is None:
+                pending.append(band)
+                continue
+            self.logger.info("BAND " + band + " found in the stage cache. Skipped")
+            if write:
+                self.writer.submit(writeToa, self.outdir, self.globalConfig.ism_toa + band, toa,
+                                   self.globalConfig.toa_compression, self.globalConfig.toa_complevel)
+            if consumer is not None:
+                consumer(band, toa)
+        return pending
+
+    def readCubeWindow(self, bands):
+        """
+        Reads only the wavelengths of the SGM cube within the ISRF of the bands
+        :param bands: list of bands
+        :return: TOA cube and wavelengths
+        """
+        sgm_wv = readCubeWv(self.indir, self.globalConfig.scene)
+        wv_min, wv_max = self.myOpt.spectralWindow(sgm_wv, bands)
+        self.logger.debug("Wavelength window of " + str(bands) + ": " + str(wv_min) + " - " + str(wv_max) + " [nm]")
+        return readCube(self.indir, self.globalConfig.scene, wv_min, wv_max)
 
 
@@ -9,6 +9,7 @@ from common.io.readMat import writeMat
 from common.plot.plotMat2D import plotMat2D
 from scipy.interpolate import interp2d
 from numpy.fft import fftshift, ifft2
+from common.src.arrayCache import hashKey
 import os
 
 class mtf:
@@ -16,10 +17,19 @@ class mtf:
     Class MTF. Collects the analytical modelling of the different contributions
     for the system MTF
     """
-    def __init__(self, logger, outdir):
-        self.ismConfig = ismConfig()
+    def __init__(self, logger, outdir, cache=None, plotter=None, config=None):
+        """
+        :param logger: logger
+        :param outdir: output directory
+        :param cache: optional arrayCache where the system MTFs are memoized
+        :param plotter: optional plotQueue for the MTF plots. If None, they are plotted immediately
+        :param config: optional ismConfig of the run. If None, a new one is created
+        """
+        self.ismConfig = ismConfig() if config is None else config
         self.logger = logger
         self.outdir = outdir
+        self.cache = cache
+        self.plotter = plotter
 
     def system_mtf(self, nlines, ncolumns, D, lambd, focal, pix_size,
                    kLF, wLF, kHF, wHF, defocus, ksmear, kmotion, directory, band):
@@ -44,6 +54,23 @@ class mtf:
 
         self.logger.info("Calculation of the System MTF")
 
+        # The MTF only depends on the size of the scene and the optics. Reuse it if already computed
+        if self.cache is not None:
+            key = hashKey('mtf', nlines, ncolumns, D, lambd, focal, pix_size,
+                          kLF, wLF, kHF, wHF, defocus, ksmear, kmotion,
+                          self.ismConfig.mtf_evaluator, self.ismConfig.mtf_lut_samples)
+            Hsys = self.cache.get(key)
+            if Hsys is not None:
+                self.logger.debug("System MTF found in the cache")
+                return Hsys
+
+        if self.ismConfig.mtf_evaluator == 'radial':
+            Hsys = self.system_mtf_radial(nlines, ncolumns, D, lambd, focal, pix_size,
+                                          kLF, wLF, kHF, wHF, defocus, ksmear, kmotion, directory, band)
+            if self.cache is not None:
+                self.cache.put(key, Hsys)
+            return Hsys
+
         # Calculate the 2D relative frequencies
         self.logger.debug("Calculation of 2D relative frequencies")
         fn2D, fr2D, fnAct, fnAlt = self.freq2d(nlines, ncolumns, D, lambd, focal, pix_size)
@@ -72,11 +99,125 @@ class mtf:
         Hsys = Hmotion * Hsmear * Hdet * Hwfe * Hdefoc * Hdiff # dummy
 
         # Plot cuts ACT/ALT of the MTF
-        self.plotMtf(Hdiff, Hdefoc, Hwfe, Hdet, Hsmear, Hmotion, Hsys, nlines, ncolumns, fnAct, fnAlt, directory, band)
+        if self.ismConfig.save_mtfs:
+            self.plotMtf(Hdiff, Hdefoc, Hwfe, Hdet, Hsmear, Hmotion, Hsys, nlines, ncolumns, fnAct, fnAlt, directory, band)
 
+        if self.cache is not None:
+            self.cache.put(key, Hsys)
 
         return Hsys
 
+    def system_mtf_radial(self, nlines, ncolumns, D, lambd, focal, pix_size,
+                          kLF, wLF, kHF, wHF, defocus, ksmear, kmotion, directory, band):
+        """
+        System MTF evaluated on radial profiles. All the contributors but the smearing
+        only depend on the radius of the frequency, so their product is evaluated once
+        on a 1D profile of ismConfig.mtf_lut_samples radii, and mapped to the 2D grid
+        by linear interpolation. The smearing (ALT only) is kept 1D and broadcast.
+        Only the system MTF is materialised in 2D.
+        Same parameters as system_mtf
+        :return: mtf
+        """
+        # 1D normalised frequencies, and conversion to relative frequencies (f/fc)
+        fnAct, fnAlt, fn2fr = self.freq1d(nlines, ncolumns, D, lambd, focal, pix_size)
+
+        # Radius of the 2D normalised frequencies
+        fn2D = np.add.outer(fnAlt*fnAlt, fnAct*fnAct)
+        np.sqrt(fn2D, out=fn2D)
+
+        # Radial profile of the product of the radial contributors
+        self.logger.debug("Calculation of the radial MTF profile")
+        nsamples = self.ismConfig.mtf_lut_samples
+        rmax = np.sqrt(np.max(fnAlt*fnAlt) + np.max(fnAct*fnAct))
+        r = np.linspace(0, rmax, nsamples)
+        Hrad = self.mtfRadial(r, fn2fr, D, lambd, focal, kLF, wLF, kHF, wHF, defocus, kmotion)
+
+        # Lookup of the radial profile, Hsys = Hrad[i] + t*(Hrad[i+1]-Hrad[i])
+        self.logger.debug("Calculation of the Sysmtem MTF by multiplying the different contributors")
+        fn2D *= (nsamples - 1) / rmax
+        idx = np.minimum(fn2D.astype(np.intp), nsamples - 2)
+        fn2D -= idx
+        fn2D *= np.diff(Hrad)[idx]
+        Hsys = Hrad[idx]
+        Hsys += fn2D
+        del fn2D, idx
+
+        # ALT smearing, broadcast over the columns
+        Hsmear = np.sinc(ksmear*fnAlt)
+        Hsys *= Hsmear[:, np.newaxis]
+
+        # Plot cuts ACT/ALT of the MTF, evaluated exactly on the 1D cuts
+        if self.ismConfig.save_mtfs:
+            cuts_act, cuts_alt = self.mtfCuts(nlines, ncolumns, fnAct, fnAlt, fn2fr, Hsys, D, lambd, focal,
+                                              kLF, wLF, kHF, wHF, defocus, ksmear, kmotion)
+            self.plotMtfCuts(cuts_act, cuts_alt, fnAct, fnAlt, directory, band)
+
+        return Hsys
+
+    def mtfRadial(self, fn, fn2fr, D, lambd, focal, kLF, wLF, kHF, wHF, defocus, kmotion):
+        """
+        Product of the MTF contributors that only depend on the radius of the frequency
+        :param fn: normalised frequencies (f/(1/w))
+        :param fn2fr: conversion factor from normalised to relative frequencies
+        :return: diffraction x defocus x WFE x detector x motion MTF
+        """
+        fr = fn * fn2fr
+        with np.errstate(invalid='ignore', divide='ignore'):
+            Hrad = self.mtfDiffract(fr) * self.mtfDefocus(fr, defocus, focal, D) \
+                   * self.mtfWfeAberrations(fr, lambd, kLF, wLF, kHF, wHF) \
+                   * self.mtfDetector(fn) * self.mtfMotion(fn, kmotion)
+        # At the origin the defocus MTF is 0/0. Its limit, and that of all the others, is 1
+        Hrad[fn == 0] = 1.0
+        return Hrad
+
+    def mtfCuts(self, nlines, ncolumns, fnAct, fnAlt, fn2fr, Hsys, D, lambd, focal,
+                kLF, wLF, kHF, wHF, defocus, ksmear, kmotion):
+        """
+        ACT and ALT cuts through the centre of all the MTF contributors
+        :return: dictionaries with the ACT and the ALT cuts of each contributor
+        """
+        ic = nlines // 2
+        jc = ncolumns // 2
+        Hsmear = np.sinc(ksmear*fnAlt)
+        cuts = []
+        for fn, smear, sys in ((np.sqrt(fnAlt[ic]**2 + fnAct**2), np.full(ncolumns, Hsmear[ic]), Hsys[ic, :]),
+                               (np.sqrt(fnAlt**2 + fnAct[jc]**2), Hsmear, Hsys[:, jc])):
+            fr = fn * fn2fr
+            cuts.append({'Diffraction': self.mtfDiffract(fr),
+                         'Defocus': self.mtfDefocus(fr, defocus, focal, D),
+                         'WFE': self.mtfWfeAberrations(fr, lambd, kLF, wLF, kHF, wHF),
+                         'Detector': self.mtfDetector(fn),
+                         'Smear': smear,
+                         'Motion': self.mtfMotion(fn, kmotion),
+                         'System MTF': sys})
+        return cuts[0], cuts[1]
+
+    def freq1d(self, nlines, ncolumns, D, lambd, focal, w):
+        """
+        Calculate the 1D normalised frequencies
+        :param nlines: Lines of the TOA
+        :param ncolumns: Columns of the TOA
+        :param D: Telescope diameter [m]
+        :param lambd: central wavelength of the band [m]
+        :param focal: focal length [m]
+        :param w: pixel size in meters [m]
+        :return fnAct: 1D normalised frequencies 2D ACT (f/(1/w))
+        :return fnAlt: 1D normalised frequencies 2D ALT (f/(1/w))
+        :return fn2fr: factor from normalised to relative frequencies (f/fc)
+        """
+        fstepAlt = 1/nlines/w
+        fstepAct = 1/ncolumns/w
+
+        # 1D frequency vectors
+        eps = 1e-10
+        fAlt = np.arange(-1 / (2*w), 1 / (2*w) - eps, fstepAlt)
+        fAct = np.arange(-1 / (2*w), 1 / (2*w) - eps, fstepAct)
+
+        # Cut-off frequency
+        fc = D / (lambd * focal)
+
+        return fAct * w, fAlt * w, 1 / (w * fc)
+
     def freq2d(self,nlines, ncolumns, D, lambd, focal, w):
         """
         Calculate the relative frequencies 2D (for the diffraction MTF)
@@ -218,82 +359,82 @@ class mtf:
         ic = nlines // 2
         jc = ncolumns // 2
 
-        # Extract 1D cuts for all MTF contributors (ACT direction)
-        cut_diff_act = Hdiff[ic, :]
-        cut_defoc_act = Hdefoc[ic, :]
-        cut_wfe_act = Hwfe[ic, :]
-        cut_det_act = Hdet[ic, :]
-        cut_smear_act = Hsmear[ic, :]
-        cut_motion_act = Hmotion[ic, :]
-        cut_sys_act = Hsys[ic, :]
-
-        # Extract 1D cuts for all MTF contributors (ALT direction)
-        cut_diff_alt = Hdiff[:, jc]
-        cut_defoc_alt = Hdefoc[:, jc]
-        cut_wfe_alt = Hwfe[:, jc]
-        cut_det_alt = Hdet[:, jc]
-        cut_smear_alt = Hsmear[:, jc]
-        cut_motion_alt = Hmotion[:, jc]
-        cut_sys_alt = Hsys[:, jc]
-
-        # Create two-panel plot
-        fig, axes = plt.subplots(1, 2, figsize=(14, 6), sharey=True)
-
-        # Color scheme
-        colors = {'Diffraction': '#1f77b4',
-                  'Defocus': '#ff7f0e',
-                  'WFE': '#2ca02c',
-                  'Detector': '#d62728',
-                  'Smear': '#9467bd',
-                  'Motion': '#8c564b',
-                  'System MTF': '#000000'}
-
-        # ACT panel (left)
-        axes[0].plot(fnAct, cut_diff_act, color=colors['Diffraction'], label='Diffraction', linewidth=1.5)
-        axes[0].plot(fnAct, cut_defoc_act, color=colors['Defocus'], label='Defocus', linewidth=1.5)
-        axes[0].plot(fnAct, cut_wfe_act, color=colors['WFE'], label='WFE', linewidth=1.5)
-        axes[0].plot(fnAct, cut_det_act, color=colors['Detector'], label='Detector', linewidth=1.5)
-        axes[0].plot(fnAct, cut_smear_act, color=colors['Smear'], label='Smear', linewidth=1.5)
-        axes[0].plot(fnAct, cut_motion_act, color=colors['Motion'], label='Motion', linewidth=1.5)
-        axes[0].plot(fnAct, cut_sys_act, color=colors['System MTF'], label='System', linewidth=2.5, linestyle='-')
-
-        axes[0].axvline(0.5, color='k', linestyle=':', alpha=0.7, label='Nyquist')  # Nyquist line
-        axes[0].set_title(f'MTF at ACT Direction')
-        axes[0].set_xlabel('Spatial frequency f/(1/w)')
-        axes[0].set_ylabel('MTF')
-        axes[0].grid(True, alpha=0.3)
-        axes[0].set_xlim([0.0, 0.55])
-        axes[0].set_ylim([0.0, 1.05])
-        axes[0].legend(loc='lower left', fontsize=9)
-
-        # ALT panel (right)
-        axes[1].plot(fnAlt, cut_diff_alt, color=colors['Diffraction'], label='Diffraction', linewidth=1.5)
-        axes[1].plot(fnAlt, cut_defoc_alt, color=colors['Defocus'], label='Defocus', linewidth=1.5)
-        axes[1].plot(fnAlt, cut_wfe_alt, color=colors['WFE'], label='WFE', linewidth=1.5)
-        axes[1].plot(fnAlt, cut_det_alt, color=colors['Detector'], label='Detector', linewidth=1.5)
-        axes[1].plot(fnAlt, cut_smear_alt, color=colors['Smear'], label='Smear', linewidth=1.5)
-        axes[1].plot(fnAlt, cut_motion_alt, color=colors['Motion'], label='Motion', linewidth=1.5)
-        axes[1].plot(fnAlt, cut_sys_alt, color=colors['System MTF'], label='System', linewidth=2.5, linestyle='-')
-
-        axes[1].axvline(0.5, color='k', linestyle=':', alpha=0.7, label='Nyquist')  # Nyquist line
-        axes[1].set_title(f'MTF at ALT Direction')
-        axes[1].set_xlabel('Spatial frequency f/(1/w)')
-        axes[1].grid(True, alpha=0.3)
-        axes[1].set_xlim([0.0, 0.55])
-        axes[1].set_ylim([0.0, 1.05])
-
-        # Overall title and layout
-        fig.suptitle(f'System MTF Analysis for {band}', fontsize=12)
-        plt.tight_layout()
-
-        # Save plot
-        fig.savefig(os.path.join(directory, f'mtf_{band}.png'), dpi=150, bbox_inches='tight')
-        plt.close(fig)
-
-        # Log results
-        # self.logger.info(f"MTF plot saved: {os.path.join(directory, f'mtf_{band}.png')}")
-        # self.logger.info(f"Band {band} - MTF@Nyquist ACT: {mtf_nyquist_act:.3f}, ALT: {mtf_nyquist_alt:.3f}")
-        # self.logger.info(f"Quality assessment: {quality}")
-    #TODO
+        # Extract 1D cuts for all MTF contributors (ACT and ALT directions)
+        contributors = {'Diffraction': Hdiff, 'Defocus': Hdefoc, 'WFE': Hwfe, 'Detector': Hdet,
+                        'Smear': Hsmear, 'Motion': Hmotion, 'System MTF': Hsys}
+        cuts_act = {name: H[ic, :] for name, H in contributors.items()}
+        cuts_alt = {name: H[:, jc] for name, H in contributors.items()}
 
+        self.plotMtfCuts(cuts_act, cuts_alt, fnAct, fnAlt, directory, band)
 
+    def plotMtfCuts(self, cuts_act, cuts_alt, fnAct, fnAlt, directory, band):
+        """
+        Plotting the ACT and ALT cuts of the system MTF and all of its contributors,
+        through the plot queue if there is one
+        """
+        if self.plotter is None:
+            plotMtfCuts(cuts_act, cuts_alt, fnAct, fnAlt, directory, band)
+        else:
+            self.plotter.submit(plotMtfCuts, cuts_act, cuts_alt, fnAct, fnAlt, directory, band)
+
+def plotMtfCuts(cuts_act, cuts_alt, fnAct, fnAlt, directory, band):
+    """
+    Plotting the ACT and ALT cuts of the system MTF and all of its contributors
+    :param cuts_act: dictionary with the ACT cut of each contributor
+    :param cuts_alt: dictionary with the ALT cut of each contributor
+    :param fnAct: normalised frequencies in the ACT direction (f/(1/w))
+    :param fnAlt: normalised frequencies in the ALT direction (f/(1/w))
+    :param directory: output directory
+    :param band: band
+    :return: N/A
+    """
+    # Create two-panel plot
+    fig, axes = plt.subplots(1, 2, figsize=(14, 6), sharey=True)
+
+    # Color scheme
+    colors = {'Diffraction': '#1f77b4',
+              'Defocus': '#ff7f0e',
+              'WFE': '#2ca02c',
+              'Detector': '#d62728',
+              'Smear': '#9467bd',
+              'Motion': '#8c564b',
+              'System MTF': '#000000'}
+
+    # ACT panel (left)
+    for name in ('Diffraction', 'Defocus', 'WFE', 'Detector', 'Smear', 'Motion'):
+        axes[0].plot(fnAct, cuts_act[name], color=colors[name], label=name, linewidth=1.5)
+    axes[0].plot(fnAct, cuts_act['System MTF'], color=colors['System MTF'], label='System', linewidth=2.5, linestyle='-')
+
+    axes[0].axvline(0.5, color='k', linestyle=':', alpha=0.7, label='Nyquist')  # Nyquist line
+    axes[0].set_title(f'MTF at ACT Direction')
+    axes[0].set_xlabel('Spatial frequency f/(1/w)')
+    axes[0].set_ylabel('MTF')
+    axes[0].grid(True, alpha=0.3)
+    axes[0].set_xlim([0.0, 0.55])
+    axes[0].set_ylim([0.0, 1.05])
+    axes[0].legend(loc='lower left', fontsize=9)
+
+    # ALT panel (right)
+    for name in ('Diffraction', 'Defocus', 'WFE', 'Detector', 'Smear', 'Motion'):
+        axes[1].plot(fnAlt, cuts_alt[name], color=colors[name], label=name, linewidth=1.5)
+    axes[1].plot(fnAlt, cuts_alt['System MTF'], color=colors['System MTF'], label='System', linewidth=2.5, linestyle='-')
+
+    axes[1].axvline(0.5, color='k', linestyle=':', alpha=0.7, label='Nyquist')  # Nyquist line
+    axes[1].set_title(f'MTF at ALT Direction')
+    axes[1].set_xlabel('Spatial frequency f/(1/w)')
+    axes[1].grid(True, alpha=0.3)
+    axes[1].set_xlim([0.0, 0.55])
+    axes[1].set_ylim([0.0, 1.05])
+
+    # Overall title and layout
+    fig.suptitle(f'System MTF Analysis for {band}', fontsize=12)
+    plt.tight_layout()
+
+    # Save plot
+    fig.savefig(os.path.join(directory, f'mtf_{band}.png'), dpi=150, bbox_inches='tight')
+    plt.close(fig)
+
+    # Log results
+    # self.logger.info(f"MTF plot saved: {os.path.join(directory, f'mtf_{band}.png')}")
+    # self.logger.info(f"Band {band} - MTF@Nyquist ACT: {mtf_nyquist_act:.3f}, ALT: {mtf_nyquist_alt:.3f}")
+    # self.logger.info(f"Quality assessment: {quality}")
@@ -1,27 +1,31 @@
 
 from ism.src.initIsm import initIsm
-from math import pi
 from ism.src.mtf import mtf
 from numpy.fft import fftshift, ifft2, fft2
 import numpy as np
+import scipy.fft
+import os
 from common.io.writeToa import writeToa
 from common.io.readIsrf import readIsrf
-from scipy.interpolate import interp1d, interp2d
 from common.plot.plotMat2D import plotMat2D
 from common.plot.plotF import plotF
 from scipy.signal import convolve2d
+from scipy.ndimage import convolve1d
 from common.src.auxFunc import getIndexBand
+from common.src.arrayCache import hashFile, hashKey
 
 class opticalPhase(initIsm):
 
-    def __init__(self, auxdir, indir, outdir):
-        super().__init__(auxdir, indir, outdir)
+    def __init__(self, auxdir, indir, outdir, context=None):
+        super().__init__(auxdir, indir, outdir, context)
 
-    def compute(self, sgm_toa, sgm_wv, band):
+    def compute(self, sgm_toa, sgm_wv, band, toa_isrf=None):
         """
         The optical phase is in charge of simulating the radiance
         to irradiance conversion, the spatial filter (PSF)
         and the spectral filter (ISRF).
+        :param toa_isrf: optional TOA of the band already integrated with the ISRF
+                    (see spectralIntegrationBands). If None, it is computed from sgm_toa
         :return: TOA image in irradiances [mW/m2/nm],
                     with spatial and spectral filter
         """
@@ -29,14 +33,17 @@ class opticalPhase(initIsm):
 
         # Calculation and application of the ISRF
         # -------------------------------------------------------------------------------
-        self.logger.info("EODP-ALG-ISM-1010: Spectral modelling. ISRF")
-        toa = self.spectralIntegration(sgm_toa, sgm_wv, band)
+        if toa_isrf is None:
+            self.logger.info("EODP-ALG-ISM-1010: Spectral modelling. ISRF")
+            toa = self.spectralIntegration(sgm_toa, sgm_wv, band)
+        else:
+            toa = toa_isrf
 
         self.logger.debug("TOA [0,0] " +str(toa[0,0]) + " [e-]")
 
         if self.ismConfig.save_after_isrf:
             saveas_str = self.globalConfig.ism_toa_isrf + band
-            writeToa(self.outdir, saveas_str, toa)
+            self.writer.submit(writeToa, self.outdir, saveas_str, toa)
 
         # Radiance to Irradiance conversion
         # -------------------------------------------------------------------------------
@@ -52,7 +59,7 @@ class opticalPhase(initIsm):
         # -------------------------------------------------------------------------------
         # Calculation and application of the system MTF
         self.logger.info("EODP-ALG-ISM-1030: Spatial modelling. PSF/MTF")
-        myMtf = mtf(self.logger, self.outdir)
+        myMtf = mtf(self.logger, self.outdir, self.getCache('mtf'), self.plotter, self.ismConfig)
         Hsys = myMtf.system_mtf(toa.shape[0], toa.shape[1],
                                 self.ismConfig.D, self.ismConfig.wv[getIndexBand(band)], self.ismConfig.f, self.ismConfig.pix_size,
                                 self.ismConfig.kLF, self.ismConfig.wLF, self.ismConfig.kHF, self.ismConfig.wHF,
@@ -60,7 +67,13 @@ class opticalPhase(initIsm):
                                 self.outdir, band)
 
         # Apply system MTF
-        toa = self.applySysMtf(toa, Hsys) # always calculated
+        if self.ismConfig.do_psf_conv:
+            kernel = self.psfKernel(Hsys, self.ismConfig.kernel_half_width)
+            toa = self.applyPsfConv(toa, kernel)
+        elif self.ismConfig.fft_backend == 'rfft':
+            toa = self.applySysMtfReal(toa, self.halfSpectrumMtf(Hsys))
+        else:
+            toa = self.applySysMtf(toa, Hsys) # always calculated
         self.logger.debug("TOA [0,0] " +str(toa[0,0]) + " [e-]")
 
 
@@ -70,16 +83,16 @@ class opticalPhase(initIsm):
         if self.ismConfig.save_optical_stage:
             saveas_str = self.globalConfig.ism_toa_optical + band
 
-            writeToa(self.outdir, saveas_str, toa)
+            self.writer.submit(writeToa, self.outdir, saveas_str, toa)
 
             title_str = 'TOA after the optical phase [mW/sr/m2]'
             xlabel_str='ACT'
             ylabel_str='ALT'
-            plotMat2D(toa, title_str, xlabel_str, ylabel_str, self.outdir, saveas_str)
+            self.plotter.submit(plotMat2D, toa, title_str, xlabel_str, ylabel_str, self.outdir, saveas_str)
 
             idalt = int(toa.shape[0]/2)
             saveas_str = saveas_str + '_alt' + str(idalt)
-            plotF([], toa[idalt,:], title_str, xlabel_str, ylabel_str, self.outdir, saveas_str)
+            self.plotter.submit(plotF, [], toa[idalt,:], title_str, xlabel_str, ylabel_str, self.outdir, saveas_str)
 
         return toa
 
@@ -108,6 +121,120 @@ class opticalPhase(initIsm):
         toa_ft=(ifft2(fft2(toa)*fftshift(Hsys))).real
         return toa_ft
 
+    def halfSpectrumMtf(self, Hsys):
+        """
+        System MTF for the real-to-complex FFT: shifted to the FFT order and
+        reduced to the non-negative ACT frequencies. The MTF is made hermitian,
+        H(f) = (H(f) + H(-f))/2, which gives the same result as taking the real
+        part of the complex inverse FFT in applySysMtf
+        :param Hsys: System MTF (centred, as returned by system_mtf)
+        :return: half-spectrum MTF, lines x (columns/2 + 1)
+        """
+        Hshift = fftshift(Hsys)
+        Hneg = np.roll(Hshift[::-1, ::-1], 1, axis=(0, 1)) # H(-f)
+        Hhalf = 0.5 * (Hshift + Hneg)[:, :Hsys.shape[1]//2 + 1]
+        return Hhalf.astype(self.fftDtype())
+
+    def applySysMtfReal(self, toa, Hhalf):
+        """
+        Application of the system MTF to the TOA with real-to-complex FFTs
+        (ismConfig.fft_precision and fft_workers set the precision and threads)
+        :param toa: Input TOA image in irradiances [mW/m2]
+        :param Hhalf: half-spectrum system MTF, see halfSpectrumMtf
+        :return: TOA image in irradiances [mW/m2]
+        """
+        workers = self.fftWorkers()
+        toa_ft = scipy.fft.rfft2(toa.astype(self.fftDtype(), copy=False), workers=workers)
+        toa_ft *= Hhalf
+        return scipy.fft.irfft2(toa_ft, s=toa.shape, workers=workers)
+
+    def psfKernel(self, Hsys, half_width):
+        """
+        Spatial PSF kernel derived from the system MTF, cropped to a half-width
+        and renormalised to the integral of the full PSF
+        :param Hsys: System MTF (centred, as returned by system_mtf)
+        :param half_width: half-width of the kernel [pixels]
+        :return: PSF kernel, (2*hw+1) x (2*hw+1), hw limited to half the size of the image
+        """
+        # Same convention as applySysMtf, so that the convolution with the full PSF gives the same result
+        psf = fftshift(ifft2(fftshift(Hsys)).real)
+        kernel = psf
+        for axis, n in enumerate(Hsys.shape):
+            # Odd crop centred on the zero lag (index n//2), with circular indices. In an even dimension,
+            # the largest crop reaches the Nyquist lag n/2 at both ends: it is the same lag of the circular
+            # convolution, so each end gets half of it and the full kernel reproduces the MTF exactly
+            hw = min(int(np.ceil(half_width)), n // 2)
+            kernel = np.take(kernel, (n // 2 + np.arange(-hw, hw + 1)) % n, axis=axis)
+            if 2 * hw == n:
+                ends = [slice(None)] * kernel.ndim
+                ends[axis] = [0, -1]
+                kernel[tuple(ends)] *= 0.5
+        return kernel * (np.sum(psf) / np.sum(kernel))
+
+    def separableKernel(self, kernel, tol):
+        """
+        Factorisation of a 2D kernel as a sum of separable ALT x ACT kernels (SVD),
+        dropping the terms with singular values below tol (relative to the first one)
+        :param kernel: 2D kernel
+        :param tol: relative tolerance of the singular values
+        :return: ALT and ACT 1D kernels (one column per term), or None if the
+                    separable convolution is not cheaper than the 2D one
+        """
+        u, sv, vt = np.linalg.svd(kernel)
+        rank = max(int(np.sum(sv > tol * sv[0])), 1)
+        if rank * (kernel.shape[0] + kernel.shape[1]) >= kernel.size:
+            return None
+        k_alt = u[:, :rank] * np.sqrt(sv[:rank])
+        k_act = vt[:rank, :].T * np.sqrt(sv[:rank])
+        return k_alt, k_act
+
+    def applyPsfConv(self, toa, kernel):
+        """
+        Application of the PSF to the TOA by convolution in the spatial domain.
+        The image is processed in tiles of lines (ismConfig.psf_tile_lines), with
+        circular boundaries as in the MTF application. The kernel is applied as
+        separable ALT and ACT 1D kernels when possible (ismConfig.psf_separable_tol)
+        :param toa: Input TOA image in irradiances [mW/m2]
+        :param kernel: PSF kernel (see psfKernel)
+        :return: TOA image in irradiances [mW/m2]
+        """
+        nlines = toa.shape[0]
+        hw = kernel.shape[0] // 2
+        tile = self.ismConfig.psf_tile_lines
+        separable = self.separableKernel(kernel, self.ismConfig.psf_separable_tol)
+        if separable is not None:
+            self.logger.debug("PSF convolution with " + str(separable[0].shape[1]) + " separable kernel(s)")
+
+        toa_psf = np.empty(toa.shape)
+        for iline in range(0, nlines, tile):
+            nblock = min(tile, nlines - iline)
+
+            # Tile with hw lines of margin at each side (wrapped at the image edges)
+            rows = np.arange(iline - hw, iline + nblock + hw) % nlines
+            block = toa[rows, :]
+
+            if separable is None:
+                conv = convolve2d(block, kernel, mode='same', boundary='wrap')
+            else:
+                k_alt, k_act = separable
+                conv = np.zeros(block.shape)
+                for iterm in range(k_alt.shape[1]):
+                    tmp = convolve1d(block, k_act[:, iterm], axis=1, mode='wrap')
+                    conv += convolve1d(tmp, k_alt[:, iterm], axis=0, mode='wrap')
+
+            toa_psf[iline:iline+nblock, :] = conv[hw:hw+nblock, :]
+
+        return toa_psf
+
+    def fftWorkers(self):
+        # Threads of the FFT of a band: by default, the CPUs are shared among the bands processed in parallel
+        if self.ismConfig.fft_workers is not None:
+            return self.ismConfig.fft_workers
+        return max(1, (os.cpu_count() or 1) // max(1, self.ismConfig.band_workers))
+
+    def fftDtype(self):
+        return np.float32 if self.ismConfig.fft_precision == 'float32' else np.float64
+
     def spectralIntegration(self, sgm_toa, sgm_wv, band):
         """
         Integration with the ISRF to retrieve one band
@@ -116,32 +243,104 @@ class opticalPhase(initIsm):
         :param band: band
         :return: TOA image 2D in radiances [mW/m2]
         """
-        # TODO
-        # DONE
+        # The interpolation onto the ISRF wavelengths and the weighted sum are both
+        # linear, so they collapse into a single vector applied to the whole cube
+        weights = self.bandWeights(sgm_wv, band)
+        toa = np.tensordot(sgm_toa, weights, axes=([2], [0]))
+        return toa
+
+    def spectralIntegrationBands(self, sgm_toa, sgm_wv, bands):
+        """
+        Integration with the ISRF of several bands in a single pass over the cube
+        :param sgm_toa: Spectrally oversampled TOA cube 3D in irradiances [mW/m2]
+        :param sgm_wv: wavelengths of the input TOA cube
+        :param bands: list of bands
+        :return: dictionary with the TOA image 2D in radiances [mW/m2] of each band
+        """
+        self.logger.info("EODP-ALG-ISM-1010: Spectral modelling. ISRF (all bands)")
+
+        # Response matrix, bands x wavelengths
+        resp = np.stack([self.bandWeights(sgm_wv, band) for band in bands])
+
+        # One product over the cube, (bands x wv) x (wv x pixels)
+        nlines, ncolumns, nwv = sgm_toa.shape
+        toa_bands = np.dot(resp, sgm_toa.reshape(-1, nwv).T).reshape(len(bands), nlines, ncolumns)
+
+        return {band: toa_bands[iband] for iband, band in enumerate(bands)}
+
+    def spectralWindow(self, sgm_wv, bands):
+        """
+        Wavelength window of the SGM cube needed by the ISRF of the bands
+        :param sgm_wv: wavelengths of the input TOA cube [nm]
+        :param bands: list of bands
+        :return: minimum and maximum wavelengths [nm] with non-zero weight
+                    (plus one sample at each side). None if there are none
+        """
+        weights = np.stack([self.bandWeights(sgm_wv, band) for band in bands])
+        iwv = np.flatnonzero(np.any(weights != 0, axis=0))
+        if iwv.size == 0:
+            return None, None
+
+        wv = np.sort(sgm_wv)
+        imin = max(np.searchsorted(wv, sgm_wv[iwv].min()) - 1, 0)
+        imax = min(np.searchsorted(wv, sgm_wv[iwv].max()) + 1, wv.size - 1)
+        return wv[imin], wv[imax]
+
+    def bandWeights(self, sgm_wv, band):
+        """
+        Spectral weights of a band over the SGM wavelengths.
+        The operator is cached, keyed on the SGM wavelengths and the ISRF file
+        :param sgm_wv: wavelengths of the input TOA cube [nm]
+        :param band: band
+        :return: weights, one per SGM wavelength
+        """
+        isrffile = self.auxdir + '/' + self.ismConfig.isrffile
+        cache = self.getCache('isrf')
+        key = hashKey('isrf', np.asarray(sgm_wv), self.ismConfig.isrffile, band,
+                      hashFile(isrffile + band + '.nc'))
+        weights = cache.get(key)
+        if weights is not None:
+            self.logger.debug("Spectral response of " + band + " found in the cache")
+            return weights
+
         # Read the ISRF and normalise it with its integral
         # ------------------------------------------------------------
         # wv in [um]
-        isrf, wv_isrf = readIsrf(self.auxdir + '/' + self.ismConfig.isrffile, band)
+        isrf, wv_isrf = readIsrf(isrffile, band)
         # Sampling, wv_isrf is 0.001 um = 1 nm, change to nm
         wv_isrf *= 1000
 
-        # Initialize toa
-        toa = np.zeros((sgm_toa.shape[0], sgm_toa.shape[1]))
-
         # Normalize the ISRF
         isrf_norm = isrf / np.sum(isrf)  # sum isrf*dwv = 1
-        print('ISRF integral (should be 1): ', np.sum(isrf_norm))
-        # Apply the filter, ialt and iact will interpolate
-        # Interpolate the input spectrum to the ISRF wavelengths
-        for ialt in range(sgm_toa.shape[0]):
-            for iact in range(sgm_toa.shape[1]):
-            # Interpolate the input spectrum to the ISRF wavelengths
-                cs = interp1d(sgm_wv, sgm_toa[ialt,iact,:], fill_value=(0, 0), bounds_error=False)
-                toa_i = cs(wv_isrf)  # interpolated spectrum at the ISRF wavelengths
-                # point by point multiplication with the ISRF normalized
-                toa_i *= isrf_norm
-                # sum the result vector and assign to the toa[ialt, iact] position
-                toa[ialt, iact] = np.sum(toa_i)
-        return toa
 
+        return cache.put(key, self.spectralWeights(sgm_wv, wv_isrf, isrf_norm))
+
+    def spectralWeights(self, sgm_wv, wv_isrf, isrf_norm):
+        """
+        Spectral weight vector of one band over the SGM wavelength grid.
+        Equivalent to interpolating each spectrum linearly to the ISRF wavelengths
+        (zero outside of the SGM grid) and summing it weighted by the ISRF.
+        :param sgm_wv: wavelengths of the input TOA cube [nm]
+        :param wv_isrf: wavelengths of the ISRF [nm]
+        :param isrf_norm: ISRF normalised to unit sum
+        :return: weights, one per SGM wavelength
+        """
+        # Sort the SGM wavelengths, as interp1d does
+        order = np.argsort(sgm_wv, kind='stable')
+        wv = np.asarray(sgm_wv, dtype=np.float64)[order]
+
+        # Bracketing samples and linear interpolation factor of every ISRF wavelength
+        idx = np.clip(np.searchsorted(wv, wv_isrf, side='right') - 1, 0, wv.size - 2)
+        t = (wv_isrf - wv[idx]) / (wv[idx + 1] - wv[idx])
+
+        # ISRF wavelengths outside of the SGM grid are filled with zeros
+        inside = (wv_isrf >= wv[0]) & (wv_isrf <= wv[-1])
+        isrf_in = np.where(inside, isrf_norm, 0.0)
+
+        weights_sorted = np.zeros(wv.size)
+        np.add.at(weights_sorted, idx, isrf_in * (1 - t))
+        np.add.at(weights_sorted, idx + 1, isrf_in * t)
 
+        weights = np.zeros(wv.size)
+        weights[order] = weights_sorted
+        return weights
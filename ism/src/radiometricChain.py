@@ -0,0 +1,194 @@
+
+from ism.src.initIsm import initIsm
+from ism.src.detectorModel import detectorModel
+import numpy as np
+from common.io.writeToa import writeToa
+from common.plot.plotMat2D import plotMat2D
+from common.plot.plotF import plotF
+from common.src.auxFunc import getIndexBand
+
+class radiometricChain(initIsm):
+    """
+    Detection stage and video chain phase fused in a single kernel.
+    The whole chain (irradiances to photons, photons to electrons, PRNU, dark signal,
+    bad/dead pixels, electrons to volts and digitisation) is applied in place on the
+    input image, by blocks of lines, with the same operations (and results) as
+    detectionPhase followed by videoChainPhase
+    """
+
+    def __init__(self, auxdir, indir, outdir, context=None):
+        super().__init__(auxdir, indir, outdir, context)
+        self.detector = detectorModel(self.auxdir, self.indir, self.outdir, self.context)
+
+    def compute(self, toa, band, rng=None):
+        """
+        Detection and video chain phases
+        :param toa: TOA image after the optical phase in irradiances [mW/m2]. Overwritten if float64
+        :param band: band
+        :param rng: optional random generator to draw a new detector (see detectorModel.maps).
+                    By default, the detector of the band
+        :return: TOA in digital numbers [DN]
+        """
+        self.logger.info("EODP-ALG-ISM-2000: Detection stage (fused with the video chain)")
+
+        cfg = self.ismConfig
+        toa = np.asarray(toa, dtype=np.float64)
+        nlines, ncolumns = toa.shape
+
+        # Intermediate outputs need the whole image after each step
+        whole = cfg.save_after_ph2e or (cfg.apply_prnu and cfg.save_after_prnu) \
+                or (cfg.apply_dark_signal and cfg.save_after_ds) or cfg.save_detection_stage
+        block_lines = nlines if whole else max(1, cfg.fused_block_bytes // (8 * ncolumns))
+
+        # Calibration maps of the detector of the band
+        det = self.detector.maps(band, ncolumns, rng)
+
+        # Compiled chain, without intermediate outputs
+        if cfg.compiled_radiometry and not whole:
+            chain = self.compileChain(band, det)
+            toa = self.applyCompiled(toa, chain, block_lines)
+            self.logger.debug("TOA [0,0] " +str(toa[0,0]) + " [DN]")
+            toa = toa.astype(cfg.dn_dtype, copy=False)
+            if cfg.save_vcu_stage:
+                self.saveStage(toa, self.globalConfig.ism_toa_vcu + band, 'TOA after the VCU phase [DN]', False)
+            return toa
+
+        # Per-band and per-column factors, from the detector maps
+        # -------------------------------------------------------------------------------
+        area_pix = cfg.pix_size * cfg.pix_size # [m2]
+        E_ph = self.constants.h_planck * self.constants.speed_light / cfg.wv[getIndexBand(band)]
+        if cfg.apply_prnu:
+            prnu_gain = 1 + det['prnu']
+        if cfg.apply_dark_signal:
+            sd = cfg.ds_A_coeff * (cfg.T/cfg.Tref)**3 * np.exp(-cfg.ds_B_coeff * (1/cfg.T - 1/cfg.Tref))
+            ds = sd * (1 + det['dsnu'])
+        dn_max = 2**cfg.bit_depth - 1
+
+        nsat = 0
+        for iline in range(0, nlines, block_lines):
+            blk = toa[iline:iline+block_lines, :]
+
+            # Irradiance to photons conversion
+            np.multiply(blk, area_pix, out=blk)
+            np.multiply(blk, cfg.t_int, out=blk)
+            np.divide(blk, 1000, out=blk)
+            np.divide(blk, E_ph, out=blk)
+
+            # Photon to electrons conversion, saturated at the FWC
+            np.multiply(blk, cfg.QE, out=blk)
+            np.minimum(blk, cfg.FWC, out=blk)
+            nsat += np.count_nonzero(blk == cfg.FWC)
+            if whole and cfg.save_after_ph2e:
+                self.writer.submit(writeToa, self.outdir, self.globalConfig.ism_toa_e + band, blk)
+
+            # PRNU
+            if cfg.apply_prnu:
+                np.multiply(blk, prnu_gain, out=blk)
+                if whole and cfg.save_after_prnu:
+                    self.writer.submit(writeToa, self.outdir, self.globalConfig.ism_toa_prnu + band, blk)
+
+            # Dark-signal
+            if cfg.apply_dark_signal:
+                np.add(blk, ds, out=blk)
+                if whole and cfg.save_after_ds:
+                    self.writer.submit(writeToa, self.outdir, self.globalConfig.ism_toa_ds + band, blk)
+
+            # Bad/dead pixels
+            if cfg.apply_bad_dead:
+                blk[:, det['bad']] *= (1 - cfg.bad_pix_red)
+                blk[:, det['dead']] *= (1 - cfg.dead_pix_red)
+
+            if whole and cfg.save_detection_stage:
+                self.saveStage(blk, self.globalConfig.ism_toa_detection + band, 'TOA after the detection phase [e-]', True)
+
+            # Electrons to Voltage - read-out & amplification
+            np.multiply(blk, cfg.OCF, out=blk)
+            np.multiply(blk, cfg.ADC_gain, out=blk)
+
+            # Digitisation
+            np.divide(blk, cfg.max_voltage - cfg.min_voltage, out=blk)
+            np.multiply(blk, dn_max, out=blk)
+            np.round(blk, out=blk)
+            np.clip(blk, 0, dn_max, out=blk)
+
+        # Percentage of saturated pixels
+        print(f'Percentage of saturated pixels = {(100 * nsat) / toa.size}')
+        self.logger.debug("TOA [0,0] " +str(toa[0,0]) + " [DN]")
+        toa = toa.astype(cfg.dn_dtype, copy=False)
+
+        if cfg.save_vcu_stage:
+            self.saveStage(toa, self.globalConfig.ism_toa_vcu + band, 'TOA after the VCU phase [DN]', False)
+
+        return toa
+
+    def compileChain(self, band, det):
+        """
+        Compiles the radiometric chain of a band. Between the FWC saturation and the
+        digitisation, all the steps are linear, so they collapse into a gain and an
+        offset per column:
+        e  = min(irradiance * e_gain, FWC)
+        DN = clip(round(e * gain + offset), 0, dn_max)
+        :param band: band
+        :param det: detector maps of the band (see detectorModel.maps)
+        :return: dictionary with e_gain, fwc, gain, offset and dn_max
+        """
+        cfg = self.ismConfig
+
+        # Irradiances to electrons [e-/(mW/m2)]
+        E_ph = self.constants.h_planck * self.constants.speed_light / cfg.wv[getIndexBand(band)]
+        e_gain = cfg.pix_size * cfg.pix_size * cfg.t_int / 1000 / E_ph * cfg.QE
+
+        # Electrons to DN, per column: PRNU, dark signal and bad/dead pixels
+        dn_max = 2**cfg.bit_depth - 1
+        ncolumns = det['prnu'].size
+        gain = np.full(ncolumns, cfg.OCF * cfg.ADC_gain / (cfg.max_voltage - cfg.min_voltage) * dn_max)
+        offset = np.zeros(ncolumns)
+        if cfg.apply_prnu:
+            gain *= 1 + det['prnu']
+        if cfg.apply_dark_signal:
+            sd = cfg.ds_A_coeff * (cfg.T/cfg.Tref)**3 * np.exp(-cfg.ds_B_coeff * (1/cfg.T - 1/cfg.Tref))
+            offset += sd * (1 + det['dsnu']) * cfg.OCF * cfg.ADC_gain / (cfg.max_voltage - cfg.min_voltage) * dn_max
+        if cfg.apply_bad_dead:
+            for idx, red in ((det['bad'], cfg.bad_pix_red), (det['dead'], cfg.dead_pix_red)):
+                gain[idx] *= (1 - red)
+                offset[idx] *= (1 - red)
+
+        return {'e_gain': e_gain, 'fwc': cfg.FWC, 'gain': gain, 'offset': offset, 'dn_max': dn_max}
+
+    def applyCompiled(self, toa, chain, block_lines):
+        """
+        Applies a compiled radiometric chain in place
+        :param toa: TOA image after the optical phase in irradiances [mW/m2] (float64, overwritten)
+        :param chain: compiled chain (see compileChain)
+        :param block_lines: lines processed at a time
+        :return: TOA in digital numbers [DN]
+        """
+        self.logger.info("EODP-ALG-ISM-2000: Detection stage and video chain (compiled)")
+        nsat = 0
+        for iline in range(0, toa.shape[0], block_lines):
+            blk = toa[iline:iline+block_lines, :]
+            np.multiply(blk, chain['e_gain'], out=blk)
+            np.minimum(blk, chain['fwc'], out=blk)
+            nsat += np.count_nonzero(blk == chain['fwc'])
+            np.multiply(blk, chain['gain'], out=blk)
+            np.add(blk, chain['offset'], out=blk)
+            np.round(blk, out=blk)
+            np.clip(blk, 0, chain['dn_max'], out=blk)
+
+        print(f'Percentage of saturated pixels = {(100 * nsat) / toa.size}')
+        return toa
+
+    def saveStage(self, toa, saveas_str, title_str, write):
+        """
+        Writes (optionally) and plots the output of a stage
+        """
+        if write:
+            self.writer.submit(writeToa, self.outdir, saveas_str, toa)
+
+        xlabel_str='ACT'
+        ylabel_str='ALT'
+        self.plotter.submit(plotMat2D, toa, title_str, xlabel_str, ylabel_str, self.outdir, saveas_str)
+
+        idalt = int(toa.shape[0]/2)
+        saveas_str = saveas_str + '_alt' + str(idalt)
+        self.plotter.submit(plotF, [], toa[idalt,:], title_str, xlabel_str, ylabel_str, self.outdir, saveas_str)
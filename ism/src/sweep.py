@@ -0,0 +1,164 @@
+
+# Parameter sweeps of the ISM configuration
+
+from ism.src.initIsm import initIsm
+from ism.src.opticalPhase import opticalPhase
+from ism.src.radiometricChain import radiometricChain
+from ism.src.detectionPhase import detectionPhase
+from ism.src.videoChainPhase import videoChainPhase
+from common.io.readCube import readCube, readCubeWv
+from common.io.writeToa import writeToa
+from common.io.mkdirOutputdir import mkdirOutputdir
+from common.src.arrayCache import hashKey
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import copy
+import os
+
+# Parameters of each stage. The ISRF integration only depends on the ISRF files, the optical
+# phase (radiances to irradiances and MTF) on the optics, and the rest on the detector
+ISRF_FIELDS = ('isrffile',)
+OPTICAL_FIELDS = ('D', 'f', 'Tr', 'wv', 'pix_size', 'wLF', 'wHF', 'kLF', 'kHF', 'defocus', 'ksmear', 'kmotion',
+                  'do_psf_conv', 'kernel_half_width', 'kernel_step', 'psf_separable_tol',
+                  'fft_backend', 'fft_precision', 'mtf_evaluator', 'mtf_lut_samples')
+
+class sweep(initIsm):
+    """
+    Runs the ISM over a grid of ismConfig overrides. Each distinct intermediate is computed once:
+    the ISRF integration for each set of ISRF files, the optical phase for each optical design,
+    and only the detection and video chain for every point. The points of an optical design are
+    processed in parallel
+    """
+
+    def __init__(self, auxdir, indir, outdir, context=None):
+        super().__init__(auxdir, indir, outdir, context)
+
+    def run(self, grid, workers=None):
+        """
+        Runs the sweep. The output of each point is written to its own folder (point_NNN)
+        and the overrides of the points are listed in sweep.txt
+        :param grid: dictionary of parameter: list of values (all the combinations are run),
+                    or list of dictionaries of overrides (one per point)
+        :param workers: threads of the pool. By default, ismConfig.band_workers
+        :return: list of the overrides of the points
+        """
+        points = self.expandGrid(grid)
+        configs = [self.pointConfig(overrides) for overrides in points]
+        bands = self.globalConfig.bands
+        workers = workers or self.ismConfig.band_workers
+        self.logger.info("Sweep of " + str(len(points)) + " points")
+
+        # List of points
+        mkdirOutputdir(self.outdir)
+        with open(os.path.join(self.outdir, 'sweep.txt'), 'w') as fid:
+            for ipoint, overrides in enumerate(points):
+                fid.write(self.pointDir(ipoint) + ' ' + ' '.join(k + '=' + repr(v) for k, v in overrides.items()) + '\n')
+
+        # Points grouped by ISRF, and then by optical design
+        groups = {}
+        for ipoint, cfg in enumerate(configs):
+            isrfkey = self.stageKey(cfg, ISRF_FIELDS)
+            optkey = self.stageKey(cfg, ISRF_FIELDS + OPTICAL_FIELDS)
+            groups.setdefault(isrfkey, {}).setdefault(optkey, []).append(ipoint)
+
+        with ThreadPoolExecutor(workers) as executor:
+            for isrfgroup in groups.values():
+
+                # ISRF integration, once for all the optical designs
+                first = configs[next(iter(isrfgroup.values()))[0]]
+                toa_isrf = self.integrate(first, bands)
+
+                for ipoints in isrfgroup.values():
+
+                    # Optical phase, once for all the detector settings
+                    myOpt = opticalPhase(self.auxdir, self.indir, self.outdir, self.pointContext(configs[ipoints[0]]))
+                    toa_opt = dict(zip(bands, executor.map(lambda band: myOpt.compute(None, None, band, toa_isrf[band]), bands)))
+                    self.logger.info("Optical design of points " + str(ipoints) + " done")
+
+                    # Detection and video chain of every point
+                    jobs = []
+                    for ipoint in ipoints:
+                        stages = self.pointStages(configs[ipoint])
+                        for band in bands:
+                            jobs.append(executor.submit(self.runPoint, stages, ipoint, band, toa_opt[band]))
+                    for job in jobs:
+                        job.result()
+
+        self.writer.flush(self.logger)
+        self.plotter.flush(self.logger)
+        self.logger.info("End of the sweep")
+        return points
+
+    def pointStages(self, cfg):
+        """
+        Detection and video chain stages of a point: the fused chain, or the detection
+        and video chain phases, as in ism.processBand (ismConfig.fused_radiometry)
+        :param cfg: ismConfig of the point
+        :return: list of stages
+        """
+        context = self.pointContext(cfg)
+        if cfg.fused_radiometry:
+            return [radiometricChain(self.auxdir, self.indir, self.outdir, context)]
+        return [detectionPhase(self.auxdir, self.indir, self.outdir, context),
+                videoChainPhase(self.auxdir, self.indir, self.outdir, context)]
+
+    def runPoint(self, stages, ipoint, band, toa_opt):
+        toa = toa_opt.copy()
+        for stage in stages:
+            toa = stage.compute(toa, band)
+        self.writer.submit(writeToa, os.path.join(self.outdir, self.pointDir(ipoint)), self.globalConfig.ism_toa + band, toa,
+                           self.globalConfig.toa_compression, self.globalConfig.toa_complevel)
+
+    def integrate(self, cfg, bands):
+        """
+        Reads the SGM cube and integrates the ISRF of all the bands
+        :param cfg: ismConfig (of any point with these ISRF)
+        :param bands: list of bands
+        :return: dictionary of TOA after the ISRF, per band
+        """
+        myOpt = opticalPhase(self.auxdir, self.indir, self.outdir, self.pointContext(cfg))
+        if cfg.read_wv_window:
+            sgm_wv = readCubeWv(self.indir, self.globalConfig.scene)
+            wv_min, wv_max = myOpt.spectralWindow(sgm_wv, bands)
+            sgm_toa, sgm_wv = readCube(self.indir, self.globalConfig.scene, wv_min, wv_max)
+        else:
+            sgm_toa, sgm_wv = readCube(self.indir, self.globalConfig.scene)
+        return myOpt.spectralIntegrationBands(sgm_toa, sgm_wv, bands)
+
+    def expandGrid(self, grid):
+        """
+        Points of a grid
+        :param grid: dictionary of parameter: list of values, or list of dictionaries of overrides
+        :return: list of dictionaries of overrides
+        """
+        if isinstance(grid, dict):
+            names = list(grid.keys())
+            return [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+        return [dict(overrides) for overrides in grid]
+
+    def pointConfig(self, overrides):
+        """
+        ismConfig of a point: the configuration of the run with the overrides,
+        without intermediate outputs
+        """
+        cfg = copy.deepcopy(self.ismConfig)
+        for name, value in overrides.items():
+            if not hasattr(cfg, name):
+                raise Exception('Unknown ismConfig parameter ' + name)
+            setattr(cfg, name, value)
+        for name in vars(cfg):
+            if name.startswith('save_'):
+                setattr(cfg, name, False)
+        return cfg
+
+    def pointContext(self, cfg):
+        # Context of the run (logger, caches, writer...) with the ismConfig of a point
+        context = copy.copy(self.context)
+        context.ismConfig = cfg
+        return context
+
+    def pointDir(self, ipoint):
+        return 'point_%03d' % ipoint
+
+    def stageKey(self, cfg, fields):
+        return hashKey([(name, getattr(cfg, name)) for name in fields])
@@ -6,8 +6,8 @@ from common.plot.plotF import plotF
 
 class videoChainPhase(initIsm):
 
-    def __init__(self, auxdir, indir, outdir):
-        super().__init__(auxdir, indir, outdir)
+    def __init__(self, auxdir, indir, outdir, context=None):
+        super().__init__(auxdir, indir, outdir, context)
 
     def compute(self, toa, band):
         self.logger.info("EODP-ALG-ISM-3000: Video Chain")
@@ -27,7 +27,8 @@ class videoChainPhase(initIsm):
         toa = self.digitisation(toa,
                           self.ismConfig.bit_depth,
                           self.ismConfig.min_voltage,
-                          self.ismConfig.max_voltage)
+                          self.ismConfig.max_voltage,
+                          self.ismConfig.dn_dtype)
 
         self.logger.debug("TOA [0,0] " +str(toa[0,0]) + " [DN]")
 
@@ -37,11 +38,11 @@ class videoChainPhase(initIsm):
             title_str = 'TOA after the VCU phase [DN]'
             xlabel_str='ACT'
             ylabel_str='ALT'
-            plotMat2D(toa, title_str, xlabel_str, ylabel_str, self.outdir, saveas_str)
+            self.plotter.submit(plotMat2D, toa, title_str, xlabel_str, ylabel_str, self.outdir, saveas_str)
 
             idalt = int(toa.shape[0]/2)
             saveas_str = saveas_str + '_alt' + str(idalt)
-            plotF([], toa[idalt,:], title_str, xlabel_str, ylabel_str, self.outdir, saveas_str)
+            self.plotter.submit(plotF, [], toa[idalt,:], title_str, xlabel_str, ylabel_str, self.outdir, saveas_str)
 
         return toa
 
@@ -59,17 +60,18 @@ class videoChainPhase(initIsm):
         toa = toa * OCF * gain_adc
         return toa
 
-    def digitisation(self, toa, bit_depth, min_voltage, max_voltage):
+    def digitisation(self, toa, bit_depth, min_voltage, max_voltage, dn_dtype='float64'):
         """
         Digitisation - conversion from Volts to Digital counts
         :param toa: input toa in [V]
         :param bit_depth: bit depth
         :param min_voltage: minimum voltage
         :param max_voltage: maximum voltage
+        :param dn_dtype: numeric type of the digital counts (e.g. 'uint16')
         :return: toa in digital counts
         """
         #TODO
         toa_dn = np.round(toa/(max_voltage-min_voltage)*(2**bit_depth-1))
         toa_dn = np.clip(toa_dn, 0, 2 ** bit_depth - 1)  # Clip to valid range 4096
-        return toa_dn
+        return toa_dn.astype(dn_dtype, copy=False)
 
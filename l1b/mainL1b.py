@@ -2,12 +2,21 @@
 # MAIN FUNCTION TO CALL THE L1B MODULE
 
 from l1b.src.l1b import l1b
+import argparse
 
 # Directory - this is the common directory for the execution of the E2E, all modules
 auxdir = r'C:\\Users\\alvaf\\OneDrive\\Desktop\\Carlos III\\TD\PROYECTO\\Proc_Datos_Tierra\\auxiliary'
 indir = r"C:\\Users\\alvaf\\OneDrive\\Desktop\\Carlos III\\Cuatri III\\Proc_datos_espacio\\EODP_TER_2021\\EODP-TS-E2E\\myoutput_ism"
 outdir = r"C:\\Users\\alvaf\\OneDrive\\Desktop\\Carlos III\\Cuatri III\\Proc_datos_espacio\\EODP_TER_2021\\EODP-TS-E2E\\myoutput_l1b"
 
-# Initialise the ISM
-myL1b = l1b(auxdir, indir, outdir)
-myL1b.processModule()
+# Initialise the L1B
+# (guarded, the background plotting processes import this file on Windows)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='L1B module')
+    parser.add_argument('--resume', action='store_true',
+                        help='Reuse the outputs of the bands found in the stage cache')
+    args = parser.parse_args()
+
+    myL1b = l1b(auxdir, indir, outdir)
+    myL1b.globalConfig.resume = args.resume
+    myL1b.processModule()
@@ -0,0 +1,133 @@
+
+from l1b.src.initL1b import initL1b
+from common.io.readFactor import readFactor, EQ_MULT, EQ_ADD, NC_EXT
+from common.src.auxFunc import getIndexBand
+from common.src.arrayCache import hashKey, hashFile
+import numpy as np
+import os
+
+class calibration(initL1b):
+    """
+    Radiometric calibration of the L1B: equalization and restoration folded into
+    a gain and an offset per column,
+    toa_l1b = (toa - eq_add) / eq_mult * gain = toa * gain_col + offset_col
+    applied in a single pass. The equalization factors of all the bands are read once
+    and kept in the 'equalization' cache.
+    For integer DN, the calibration can be a lookup table of the radiance of every
+    DN code (per column if equalized), applied as a gather
+    """
+
+    def __init__(self, auxdir, indir, outdir, context=None):
+        super().__init__(auxdir, indir, outdir, context)
+        self.cache = self.getCache('equalization')
+        self.factors = {}
+        self.luts = {}
+
+    def preload(self, bands):
+        """
+        Reads the equalization factors of the bands
+        :param bands: list of bands
+        :return: NA
+        """
+        for band in bands:
+            self.eqFactors(band)
+
+    def eqFactors(self, band):
+        """
+        Equalization factors of a band
+        :param band: band
+        :return: dictionary with the additive 'eq_add' [DN] and multiplicative 'eq_mult' [-] factors, per column
+        """
+        if band not in self.factors:
+            multfile = os.path.join(self.auxdir, self.l1bConfig.eq_mult + band + NC_EXT)
+            addfile = os.path.join(self.auxdir, self.l1bConfig.eq_add + band + NC_EXT)
+            key = hashKey('eq', hashFile(multfile), hashFile(addfile))
+            factors = self.cache.get(key)
+            if factors is None:
+                factors = self.cache.put(key, {'eq_mult': readFactor(multfile, EQ_MULT).astype(np.float64),
+                                               'eq_add': readFactor(addfile, EQ_ADD).astype(np.float64)})
+            self.factors[band] = factors
+        return self.factors[band]
+
+    def coefficients(self, band, ncolumns, gain):
+        """
+        Gain and offset per column of the calibration
+        :param band: band
+        :param ncolumns: number of columns
+        :param gain: absolute gain [mW/m2/sr/DN] (1 for the equalization only)
+        :return: gain [mW/m2/sr/DN] and offset [mW/m2/sr], per column
+        """
+        if not self.l1bConfig.do_equalization:
+            return np.full(ncolumns, float(gain)), np.zeros(ncolumns)
+        factors = self.eqFactors(band)
+        gain_col = gain / factors['eq_mult']
+        return gain_col, -factors['eq_add'] * gain_col
+
+    def apply(self, toa, band, gain=None):
+        """
+        Applies the calibration of a band
+        :param toa: TOA in DN (not modified)
+        :param band: band
+        :param gain: absolute gain [mW/m2/sr/DN]. By default, that of the band in l1bConfig.
+                     With gain=1, the output is the equalized TOA in DN
+        :return: TOA in radiances [mW/m2/sr] (float64)
+        """
+        if gain is None:
+            gain = self.l1bConfig.gain[getIndexBand(band)]
+        if self.useLut(toa):
+            out = self.applyLut(toa, self.lut(band, toa.shape[1], gain))
+        else:
+            gain_col, offset_col = self.coefficients(band, toa.shape[1], gain)
+            out = np.multiply(toa, gain_col, dtype=np.float64)
+            np.add(out, offset_col, out=out)
+        self.logger.debug('Sanity check. TOA in radiances after gain application ' + str(out[1,-1]) + ' [mW/m2/sr]')
+        return out
+
+    def useLut(self, toa):
+        """
+        Whether the calibration of an image is done with a lookup table (see l1bConfig.calibration_lut)
+        """
+        mode = self.l1bConfig.calibration_lut
+        if mode == 'none' or (mode == 'band' and self.l1bConfig.do_equalization):
+            return False
+        if not np.issubdtype(toa.dtype, np.integer):
+            return False
+        ncodes = 2**self.l1bConfig.bit_depth
+        if np.issubdtype(toa.dtype, np.unsignedinteger) and np.iinfo(toa.dtype).max < ncodes:
+            return True # All the codes of the type are in the table
+        # Single pass bounds check: as unsigned, negative codes are beyond the table too
+        unsigned = toa.view(np.dtype('u' + str(toa.dtype.itemsize)))
+        return unsigned.max() < ncodes
+
+    def lut(self, band, ncolumns, gain):
+        """
+        Lookup table of the calibration: radiance of every DN code
+        :param band: band
+        :param ncolumns: number of columns
+        :param gain: absolute gain [mW/m2/sr/DN]
+        :return: LUT (codes) without equalization, or (columns, codes) with it [mW/m2/sr]
+        """
+        key = (band, ncolumns, float(gain), self.l1bConfig.do_equalization)
+        if key not in self.luts:
+            gain_col, offset_col = self.coefficients(band, ncolumns, gain)
+            dn = np.arange(2**self.l1bConfig.bit_depth, dtype=np.float64)
+            if self.l1bConfig.do_equalization:
+                table = dn[np.newaxis, :] * gain_col[:, np.newaxis] + offset_col[:, np.newaxis]
+            else:
+                table = dn * gain_col[0] + offset_col[0]
+            self.luts[key] = table
+        return self.luts[key]
+
+    def applyLut(self, toa, lut):
+        """
+        Calibration of integer DN with a lookup table
+        :param toa: TOA in DN (integer)
+        :param lut: LUT (see lut)
+        :return: TOA in radiances [mW/m2/sr] (float64)
+        """
+        if lut.ndim == 1:
+            return np.take(lut, toa, mode='clip')
+        # Index of the code in the table of its column
+        idx = toa.astype(np.intp)
+        idx += np.arange(toa.shape[1]) * lut.shape[1]
+        return np.take(lut.ravel(), idx)
@@ -6,13 +6,15 @@ import os
 
 
 class initL1b(baseModule):
-    def __init__(self, auxdir, indir, outdir):
+    def __init__(self, auxdir, indir, outdir, context=None):
 
         # Initialise baseModule (the log, etc.)
-        super().__init__(auxdir, indir, outdir, "L1B")
+        super().__init__(auxdir, indir, outdir, "L1B", context)
 
         # Init Local config
-        self.l1bConfig = l1bConfig()
+        if self.context.l1bConfig is None:
+            self.context.l1bConfig = l1bConfig()
+        self.l1bConfig = self.context.l1bConfig
 
         # Make sure the logger is enabled
         self.logger.disabled = False
@@ -2,57 +2,176 @@
 # LEVEL-1B MODULE
 
 from l1b.src.initL1b import initL1b
-from common.io.writeToa import writeToa, readToa
+from l1b.src.calibration import calibration
+from common.io.writeToa import writeToa, readToa, readToaBlocks, toaAppender
 from common.src.auxFunc import getIndexBand
 from common.io.readFactor import readFactor, EQ_MULT, EQ_ADD, NC_EXT
+from common.src.arrayCache import hashKey, hashFile, configKey
 import numpy as np
 import os
 import matplotlib.pyplot as plt
 
 class l1b(initL1b):
 
-    def __init__(self, auxdir, indir, outdir):
-        super().__init__(auxdir, indir, outdir)
+    def __init__(self, auxdir, indir, outdir, context=None):
+        super().__init__(auxdir, indir, outdir, context)
+        self.myCal = calibration(self.auxdir, self.indir, self.outdir, self.context)
+
+        # Keys of the band outputs in the stage cache
+        self.stageKeys = {}
 
     def processModule(self):
 
         self.logger.info("Start of the L1B Processing Module")
 
-        for band in self.globalConfig.bands:
+        try:
+            # Equalization factors of all the bands, read once
+            self.preload()
 
-            self.logger.info("Start of BAND " + band)
+            for band in self.globalConfig.bands:
+                self.processBand(band)
+        finally:
+            # Wait for the products still being written (also if a band failed)
+            self.writer.flush(self.logger)
+            self.plotter.flush(self.logger)
 
-            # Read TOA - output of the ISM in Digital Numbers
-            # -------------------------------------------------------------------------------
-            toa = readToa(self.indir, self.globalConfig.ism_toa + band + '.nc') #leemos la imagen de input
+        self.logger.info("End of the L1B Module!")
 
-            # Equalization (radiometric correction)
-            # -------------------------------------------------------------------------------
-            if self.l1bConfig.do_equalization: #comprobar que está a true (por defecto lo está)
-                self.logger.info("EODP-ALG-L1B-1010: Radiometric Correction (equalization)")
+    def preload(self):
+        """
+        Reads the equalization factors of all the bands (fused calibration)
+        :return: NA
+        """
+        if self.l1bConfig.do_equalization and self.l1bConfig.fused_calibration:
+            self.myCal.preload(self.globalConfig.bands)
+
+    def processBand(self, band, toa=None, write=True, inputkey=None):
+        """
+        Processing of one band: equalization and restoration
+        :param band: band
+        :param toa: TOA in DN, output of the ISM (not modified). If None, it is read from the input folder
+        :param write: whether the output TOA is written (the equalized TOA is controlled by save_eq_stage)
+        :param inputkey: optional stage cache key of the ISM output, used instead of hashing the TOA
+        :return: TOA in radiances [mW/m2/sr] (None in streaming mode)
+        """
+        self.logger.info("Start of BAND " + band)
 
-                # Read the multiplicative and additive factors from auxiliary/equalization/
-                eq_mult = readFactor(os.path.join(self.auxdir,self.l1bConfig.eq_mult+band+NC_EXT),EQ_MULT)
-                eq_add = readFactor(os.path.join(self.auxdir,self.l1bConfig.eq_add+band+NC_EXT),EQ_ADD)
+        # Streaming by blocks of lines
+        # -------------------------------------------------------------------------------
+        if toa is None and self.l1bConfig.stream_lines > 0 and self.l1bConfig.fused_calibration:
+            self.processBandStream(band)
+            self.logger.info("End of BAND " + band)
+            return None
 
-                # Do the equalization and save to file
-                toa = self.equalization(toa, eq_add, eq_mult) #esta es la función que hay que implementar (está más abajo la definición)
-                writeToa(self.outdir, self.globalConfig.l1b_toa_eq + band, toa)
+        # Read TOA - output of the ISM in Digital Numbers
+        # -------------------------------------------------------------------------------
+        if toa is None:
+            toa = readToa(self.indir, self.globalConfig.ism_toa + band + '.nc') #leemos la imagen de input
 
-            # Restitution (absolute radiometric gain)
+        # Outputs of a previous run with the same input and configuration (resume mode)
+        # -------------------------------------------------------------------------------
+        stages = self.context.getStageCache()
+        if stages is not None:
+            stagekey = self.stageKey(toa, band, inputkey)
+            self.stageKeys[band] = stagekey
+            cached = stages.get(stagekey) if self.globalConfig.resume else None
+            if cached is not None:
+                self.logger.info("BAND " + band + " found in the stage cache. Skipped")
+                if 'toa_eq' in cached:
+                    self.writer.submit(writeToa, self.outdir, self.globalConfig.l1b_toa_eq + band, cached['toa_eq'])
+                if write:
+                    self.writer.submit(writeToa, self.outdir, self.globalConfig.l1b_toa + band, cached['toa'])
+                self.plotL1bToa(cached['toa'], self.outdir, band)
+                return cached['toa']
+        stage = {}
+
+        if self.l1bConfig.fused_calibration:
+            # Equalization and restoration, in one pass
             # -------------------------------------------------------------------------------
+            self.logger.info("EODP-ALG-L1B-1010: Radiometric Correction (equalization) and "
+                             "EODP-ALG-L1B-1020: Absolute radiometric gain application (restoration)")
+            if self.l1bConfig.do_equalization and self.l1bConfig.save_eq_stage:
+                stage['toa_eq'] = self.myCal.apply(toa, band, 1)
+                self.writer.submit(writeToa, self.outdir, self.globalConfig.l1b_toa_eq + band, stage['toa_eq'])
+            toa = self.myCal.apply(toa, band)
+
+        # Equalization (radiometric correction)
+        # -------------------------------------------------------------------------------
+        elif self.l1bConfig.do_equalization: #comprobar que está a true (por defecto lo está)
+            self.logger.info("EODP-ALG-L1B-1010: Radiometric Correction (equalization)")
+
+            # Read the multiplicative and additive factors from auxiliary/equalization/
+            eq_mult = readFactor(os.path.join(self.auxdir,self.l1bConfig.eq_mult+band+NC_EXT),EQ_MULT)
+            eq_add = readFactor(os.path.join(self.auxdir,self.l1bConfig.eq_add+band+NC_EXT),EQ_ADD)
+
+            # Do the equalization and save to file
+            toa = self.equalization(toa, eq_add, eq_mult) #esta es la función que hay que implementar (está más abajo la definición)
+            if self.l1bConfig.save_eq_stage:
+                self.writer.submit(writeToa, self.outdir, self.globalConfig.l1b_toa_eq + band, toa)
+                stage['toa_eq'] = toa
+
+        # Restitution (absolute radiometric gain)
+        # -------------------------------------------------------------------------------
+        if not self.l1bConfig.fused_calibration:
             self.logger.info("EODP-ALG-L1B-1020: Absolute radiometric gain application (restoration)")
             toa = self.restoration(toa, self.l1bConfig.gain[getIndexBand(band)])
 
-            # Write output TOA
-            # -------------------------------------------------------------------------------
-            writeToa(self.outdir, self.globalConfig.l1b_toa + band, toa)
-            self.plotL1bToa(toa, self.outdir, band)
+        # Write output TOA
+        # -------------------------------------------------------------------------------
+        if write:
+            self.writer.submit(writeToa, self.outdir, self.globalConfig.l1b_toa + band, toa)
+        self.plotL1bToa(toa, self.outdir, band)
 
-            self.logger.info("End of BAND " + band)
+        # Keep it for the next runs
+        if stages is not None:
+            stage['toa'] = toa
+            stages.put(stagekey, stage)
 
-        self.logger.info("End of the L1B Module!")
+        self.logger.info("End of BAND " + band)
+        return toa
 
+    def processBandStream(self, band):
+        """
+        Calibration of a band by blocks of lines (ALT), with bounded memory: each block is
+        read (ahead, in the background), calibrated and appended to the outputs (by the writer)
+        :param band: band
+        :return: NA
+        """
+        self.logger.info("EODP-ALG-L1B-1010: Radiometric Correction (equalization) and "
+                         "EODP-ALG-L1B-1020: Absolute radiometric gain application (restoration), "
+                         "by blocks of " + str(self.l1bConfig.stream_lines) + " lines")
+        block_lines = self.l1bConfig.stream_lines
+        save_eq = self.l1bConfig.do_equalization and self.l1bConfig.save_eq_stage
+
+        out = None
+        for iline, toa in readToaBlocks(self.indir, self.globalConfig.ism_toa + band + '.nc', block_lines):
+            if out is None:
+                out = toaAppender(self.outdir, self.globalConfig.l1b_toa + band, toa.shape[1], 'float32', block_lines)
+                if save_eq:
+                    out_eq = toaAppender(self.outdir, self.globalConfig.l1b_toa_eq + band, toa.shape[1], 'float32', block_lines)
+            if save_eq:
+                self.writer.submit(out_eq.append, self.myCal.apply(toa, band, 1))
+            self.writer.submit(out.append, self.myCal.apply(toa, band))
+
+        if out is not None:
+            self.writer.submit(out.close)
+            if save_eq:
+                self.writer.submit(out_eq.close)
+
+    def stageKey(self, toa, band, inputkey=None):
+        """
+        Key of the L1B output of a band in the stage cache: the input TOA,
+        the configuration and the equalization factors
+        :param toa: input TOA in DN
+        :param band: band
+        :param inputkey: optional key of the input TOA (that of the ISM output), instead of its hash
+        :return: hexadecimal key
+        """
+        eqfiles = []
+        if self.l1bConfig.do_equalization:
+            eqfiles = [hashFile(os.path.join(self.auxdir, self.l1bConfig.eq_mult + band + NC_EXT)),
+                       hashFile(os.path.join(self.auxdir, self.l1bConfig.eq_add + band + NC_EXT))]
+        return hashKey('l1b', toa if inputkey is None else inputkey, band, configKey(self.l1bConfig), eqfiles)
 
     def equalization(self, toa, eq_add, eq_mult):
         """
@@ -2,6 +2,7 @@
 # MAIN FUNCTION TO CALL THE L1C MODULE
 
 from l1c.src.l1c import l1c
+import argparse
 
 # Directory - this is the common directory for the execution of the E2E, all modules
 # GM dir + L1B dir
@@ -9,6 +10,14 @@ auxdir = r'C:\\Users\\alvaf\\OneDrive\\Desktop\\Carlos III\\TD\PROYECTO\\Proc_Da
 indir = r"C:\\Users\\alvaf\\OneDrive\Desktop\\Carlos III\\Cuatri III\\Proc_datos_espacio\\EODP_TER_2021\\EODP-TS-L1C\\input\\gm_alt100_act_150,C:\\Users\\alvaf\\OneDrive\\Desktop\\Carlos III\\Cuatri III\\Proc_datos_espacio\\EODP_TER_2021\\EODP-TS-L1B\\myoutput"
 outdir = r"C:\\Users\\alvaf\\OneDrive\\Desktop\\Carlos III\\Cuatri III\\Proc_datos_espacio\\EODP_TER_2021\\EODP-TS-L1C\\myoutput"
 
-# Initialise the ISM
-myL1c = l1c(auxdir, indir, outdir)
-myL1c.processModule()
+# Initialise the L1C
+# (guarded, the background plotting processes import this file on Windows)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='L1C module')
+    parser.add_argument('--resume', action='store_true',
+                        help='Reuse the outputs of the bands found in the stage cache')
+    args = parser.parse_args()
+
+    myL1c = l1c(auxdir, indir, outdir)
+    myL1c.globalConfig.resume = args.resume
+    myL1c.processModule()
@@ -3,13 +3,15 @@ from config.l1cConfig import l1cConfig
 from common.src.baseModule import baseModule
 
 class initL1c(baseModule):
-    def __init__(self, auxdir, indir, outdir):
+    def __init__(self, auxdir, indir, outdir, context=None):
 
         # Initialise baseModule (the log, etc.)
-        super().__init__(auxdir, indir, outdir, "L1C")
+        super().__init__(auxdir, indir, outdir, "L1C", context)
 
         # Init Local config
-        self.l1cConfig = l1cConfig()
+        if self.context.l1cConfig is None:
+            self.context.l1cConfig = l1cConfig()
+        self.l1cConfig = self.context.l1cConfig
 
         # Make sure the logger is enabled
         self.logger.disabled = False
@@ -2,46 +2,132 @@
 # LEVEL-1C
 
 from l1c.src.initL1c import initL1c
+from l1c.src.resampler import resampler
 from common.io.writeToa import writeToa, readToa
 from common.io.readGeodetic import readGeodetic, getCorners
-import mgrs
+from common.src.arrayCache import hashKey, hashFile, configKey
 import numpy as np
-from scipy.interpolate import bisplrep, bisplev
 import matplotlib.pyplot as plt
 from common.io.l1cProduct import writeL1c
 from matplotlib import cm
+import os
+import sys
 
 class l1c(initL1c):
 
-    def __init__(self, auxdir, indir, outdir):
-        super().__init__(auxdir, indir, outdir)
+    def __init__(self, auxdir, indir, outdir, context=None):
+        super().__init__(auxdir, indir, outdir, context)
+
+        # Geodetic coordinates of the L1B pixels, the same for all the bands (read on first use),
+        # and the hash of the geolocation file
+        self.lat = None
+        self.lon = None
+        self.geoKey = None
+
+        # Resampling onto the L1C grid, computed once for the geometry of the L1B pixels
+        self.myRes = resampler(self.auxdir, self.indir, self.outdir, self.context)
 
     def processModule(self):
 
         self.logger.info("Start of the L1C Processing Module")
 
-        for band in self.globalConfig.bands:
+        try:
+            # All the bands, resampled at once
+            self.processBands(self.globalConfig.bands)
+        finally:
+            # Wait for the products still being written (also if a band failed)
+            self.writer.flush(self.logger)
 
-            self.logger.info("Start of BAND " + band)
+        self.logger.info("End of the L1C Module!")
 
-            # Read TOA - output of the L1B in Radiances
-            # -------------------------------------------------------------------------------
-            toa = readToa(self.l1bdir, self.globalConfig.l1b_toa + band + '.nc')
-            lat,lon = readGeodetic(self.gmdir, self.globalConfig.gm_geoloc)
+    def processBand(self, band, toa=None, inputkey=None):
+        """
+        Processing of one band: reprojection onto the MGRS grid
+        :param band: band
+        :param toa: L1B TOA in radiances [mW/m2/sr] (not modified). If None, it is read from the L1B folder
+        :param inputkey: optional stage cache key of the L1B output, used instead of hashing the TOA
+        :return: L1C latitude, longitude [deg] and radiances [mW/m2/sr]
+        """
+        return self.processBands([band], None if toa is None else [toa], None if inputkey is None else [inputkey])[band]
+
+    def processBands(self, bands, toas=None, inputkeys=None):
+        """
+        Processing of several bands: reprojection onto the MGRS grid, of all of them at once
+        :param bands: list of bands
+        :param toas: list of L1B TOA in radiances [mW/m2/sr] (not modified). If None, they are read from the L1B folder
+        :param inputkeys: optional list of the stage cache keys of the L1B outputs, used instead of hashing the TOA
+        :return: dictionary of the L1C latitude, longitude [deg] and radiances [mW/m2/sr], per band
+        """
+        # Read TOA - output of the L1B in Radiances
+        # -------------------------------------------------------------------------------
+        if toas is None:
+            toas = [readToa(self.l1bdir, self.globalConfig.l1b_toa + band + '.nc') for band in bands]
+        lat, lon = self.geolocation()
+        for toa in toas:
             self.checkSize(lat,toa)
 
-            # L1C reprojection onto the MGRS grid
-            # -------------------------------------------------------------------------------
-            lat_l1c, lon_l1c, toa_l1c = self.l1cProjtoa(lat, lon, toa, band)
+        # Outputs of a previous run with the same input and configuration (resume mode)
+        # -------------------------------------------------------------------------------
+        results = {}
+        stagekeys = {}
+        stages = self.context.getStageCache()
+        for iband, (band, toa) in enumerate(zip(bands, toas)):
+            if stages is None:
+                continue
+            stagekeys[band] = self.stageKey(toa, band, None if inputkeys is None else inputkeys[iband])
+            cached = stages.get(stagekeys[band]) if self.globalConfig.resume else None
+            if cached is not None:
+                self.logger.info("BAND " + band + " found in the stage cache. Skipped")
+                self.writer.submit(writeL1c, self.outdir, self.globalConfig.l1c_toa + band,
+                                   cached['lat'], cached['lon'], cached['toa'])
+                results[band] = cached['lat'], cached['lon'], cached['toa']
+
+        pending = [iband for iband, band in enumerate(bands) if band not in results]
+        if not pending:
+            return results
+        self.logger.info("Start of BANDS " + str([bands[iband] for iband in pending]))
+
+        # L1C reprojection onto the MGRS grid
+        # -------------------------------------------------------------------------------
+        toa = np.stack([toas[iband] for iband in pending], axis=-1)
+        lat_l1c, lon_l1c, toa_l1c = self.l1cProjtoa(lat, lon, toa, [bands[iband] for iband in pending])
+
+        for icol, iband in enumerate(pending):
+            band = bands[iband]
+            results[band] = lat_l1c, lon_l1c, toa_l1c[:, icol]
 
             # Write output TOA
             # -------------------------------------------------------------------------------
-            writeL1c(self.outdir, self.globalConfig.l1c_toa + band, lat_l1c, lon_l1c, toa_l1c)
+            self.writer.submit(writeL1c, self.outdir, self.globalConfig.l1c_toa + band, *results[band])
 
-            self.logger.info("End of BAND " + band)
+            # Keep it for the next runs
+            if stages is not None:
+                stages.put(stagekeys[band], {'lat': lat_l1c, 'lon': lon_l1c, 'toa': results[band][2]})
 
-        self.logger.info("End of the L1C Module!")
+            self.logger.info("End of BAND " + band)
+        return results
 
+    def stageKey(self, toa, band, inputkey=None):
+        """
+        Key of the L1C output of a band in the stage cache: the input TOA,
+        the configuration and the geolocation of the GM
+        :param toa: L1B TOA in radiances
+        :param band: band
+        :param inputkey: optional key of the input TOA (that of the L1B output), instead of its hash
+        :return: hexadecimal key
+        """
+        self.geolocation()
+        return hashKey('l1c', toa if inputkey is None else inputkey, band, configKey(self.l1cConfig), self.geoKey)
+
+    def geolocation(self):
+        """
+        Geodetic coordinates of the L1B pixels, output of the GM (read once)
+        :return: latitude and longitude matrices [deg]
+        """
+        if self.lat is None:
+            self.geoKey = hashFile(os.path.join(self.gmdir, self.globalConfig.gm_geoloc))
+            self.lat, self.lon = readGeodetic(self.gmdir, self.globalConfig.gm_geoloc)
+        return self.lat, self.lon
 
     def l1cProjtoa(self, lat, lon, toa, band):
         '''
@@ -53,25 +139,30 @@ class l1c(initL1c):
         31 is the UTM zone, R is the UTM latitude band; EQ are the MGRS column and row band letters
         43673 is the MGRS Easting (5 dig); 74067 is the MGRS Northing (5dig)
 
-        Python mgrs library documentation
-        https://pypi.org/project/mgrs/
+        The MGRS coordinates are derived from the UTM coordinates of all the pixels at once
+        (see mgrsGrid), and the radiances are resampled onto the MGRS points at the precision
+        of l1cConfig.mgrs_tile_precision within the footprint of the L1B, with a sparse
+        operator computed once per geolocation (see resampler)
 
         :param lat: L1B latitudes [deg]
         :param lon: L1B longitudes [deg]
-        :param toa: L1B radiances
-        :param band: band
-        :return: L1C radiances, L1C latitude and longitude in degrees
+        :param toa: L1B radiances (ALT, ACT), or several bands stacked (ALT, ACT, bands)
+        :param band: band, or list of bands
+        :return: L1C latitude and longitude in degrees, and L1C radiances (points), or (points, bands)
         '''
-        #TODO
+        self.logger.info("EODP-ALG-L1C-1010: Reprojection onto the MGRS grid")
 
-        tck = bisplrep(lat, lon, toa)
-        mgrs_tiles = set([])
-        m = mgrs.MGRS()
-        for iact in range(lat.shape[0])
-            for ialt in range (lon.shape[0])
-                mgrs_tiles.add(m.toMGRS(lar[i,j], lon[i, j], inDegrees=True,
+        # Resampling operator of the geometry (that of the geolocation file, or of the given coordinates)
+        if lat is self.lat and lon is self.lon:
+            geokey = self.geoKey
+        else:
+            geokey = hashKey(lat, lon)
+        operator = self.myRes.operator(lat, lon, geokey)
 
-        return lat_l1c, lon_l1c, toa_l1c
+        # All the bands in one sparse matrix product
+        toa_l1c = self.myRes.resample(operator, toa)
+        self.logger.debug("L1C grid of " + str(toa_l1c.shape[0]) + " points")
+        return operator['lat'], operator['lon'], toa_l1c
 
     def checkSize(self, lat,toa):
         '''
@@ -81,4 +172,7 @@ class l1c(initL1c):
         :param toa: Radiance 2D matrix
         :return: NA
         '''
-        #TODO
+        if lat.shape != toa.shape:
+            self.logger.error("The size of the L1B TOA " + str(toa.shape) +
+                              " does not match that of the geolocation " + str(lat.shape))
+            sys.exit("The size of the L1B TOA does not match that of the geolocation. Exiting.")
@@ -0,0 +1,151 @@
+
+from l1c.src.initL1c import initL1c
+from pyproj import Transformer
+from scipy.spatial import Delaunay
+from functools import lru_cache
+import numpy as np
+
+# MGRS letters: latitude bands (8 deg, from 80S), and the column and row letters of the 100 km squares.
+# The column letters cycle every 3 UTM zones, and the rows of the even zones are shifted by 5 letters
+MGRS_BANDS = 'CDEFGHJKLMNPQRSTUVWX'
+MGRS_COLUMNS = ('ABCDEFGH', 'JKLMNPQR', 'STUVWXYZ')
+MGRS_ROWS = 'ABCDEFGHJKLMNPQRSTUV'
+MGRS_SQUARE = 100000 # [m] Size of the 100 km squares
+
+@lru_cache(maxsize=None)
+def utmTransformer(zone, south):
+    """
+    Transformer from geodetic coordinates (WGS84) to a UTM zone, created once per zone
+    :param zone: UTM zone (1-60)
+    :param south: whether it is the southern hemisphere
+    :return: pyproj Transformer (lon, lat) -> (easting, northing)
+    """
+    epsg = (32700 if south else 32600) + zone
+    return Transformer.from_crs('EPSG:4326', 'EPSG:' + str(epsg), always_xy=True)
+
+class mgrsGrid(initL1c):
+    """
+    MGRS grid of the L1C. The geodetic coordinates of the L1B pixels are converted to UTM
+    in one call per zone, and the MGRS zone, band, 100 km square and easting/northing are
+    derived from them with numpy. The L1C grid is made of the MGRS points, at the precision
+    of l1cConfig.mgrs_tile_precision, within the footprint of the L1B
+    """
+
+    def __init__(self, auxdir, indir, outdir, context=None):
+        super().__init__(auxdir, indir, outdir, context)
+
+    def utmZone(self, lat, lon):
+        """
+        UTM zone of geodetic coordinates, with the exceptions of southern Norway and Svalbard
+        :param lat: latitude [deg]
+        :param lon: longitude [deg]
+        :return: UTM zone (1-60), same shape as the inputs
+        """
+        lat = np.asarray(lat)
+        lon = (np.asarray(lon) + 180) % 360 - 180
+        zone = (np.floor((lon + 180) / 6).astype(int) % 60) + 1
+        zone = np.where((lat >= 56) & (lat < 64) & (lon >= 3) & (lon < 12), 32, zone)
+        svalbard = (lat >= 72) & (lon >= 0) & (lon < 42)
+        zone = np.where(svalbard, 2 * np.floor((lon + 3) / 12).astype(int) + 31, zone)
+        return zone
+
+    def toUtm(self, lat, lon, zone, south):
+        """
+        Projection onto a UTM zone
+        :param lat: latitude [deg]
+        :param lon: longitude [deg]
+        :param zone: UTM zone
+        :param south: whether it is the southern hemisphere
+        :return: easting and northing [m]
+        """
+        return utmTransformer(int(zone), bool(south)).transform(lon, lat)
+
+    def fromUtm(self, easting, northing, zone, south):
+        """
+        Geodetic coordinates of UTM coordinates
+        :param easting: easting [m]
+        :param northing: northing [m]
+        :param zone: UTM zone
+        :param south: whether it is the southern hemisphere
+        :return: latitude and longitude [deg]
+        """
+        lon, lat = utmTransformer(int(zone), bool(south)).transform(easting, northing, direction='INVERSE')
+        return lat, lon
+
+    def codes(self, lat, zone, easting, northing):
+        """
+        MGRS coordinates, as numbers
+        :param lat: latitude [deg]
+        :param zone: UTM zone
+        :param easting: UTM easting [m]
+        :param northing: UTM northing [m] (with the false northing in the south)
+        :return: dictionary with the 'zone', the index of the latitude 'band' (in MGRS_BANDS),
+                 of the 'column' and 'row' letters of the 100 km square (in MGRS_COLUMNS[(zone-1)%3]
+                 and MGRS_ROWS), and the 'easting' and 'northing' within the square, truncated at
+                 the precision of the configuration [m]
+        """
+        res = self.resolution()
+        easting = np.asarray(easting)
+        northing = np.asarray(northing)
+        band = np.clip(np.floor((np.asarray(lat) + 80) / 8).astype(int), 0, len(MGRS_BANDS) - 1)
+        column = np.floor(easting / MGRS_SQUARE).astype(int) - 1
+        row = (np.floor(northing / MGRS_SQUARE).astype(int) + 5 * (1 - zone % 2)) % len(MGRS_ROWS)
+        return {'zone': zone, 'band': band, 'column': column, 'row': row,
+                'easting': np.floor(easting % MGRS_SQUARE / res) * res,
+                'northing': np.floor(northing % MGRS_SQUARE / res) * res}
+
+    def tileNames(self, codes):
+        """
+        Names of the MGRS tiles (zone, band and 100 km square) in a set of MGRS coordinates
+        :param codes: MGRS coordinates (see codes)
+        :return: sorted list of names, e.g. '31TCG'
+        """
+        tiles = np.unique(np.stack([np.broadcast_to(codes[name], np.shape(codes['band'])).ravel()
+                                    for name in ('zone', 'band', 'column', 'row')]), axis=1)
+        return ['%02d%s%s%s' % (zone, MGRS_BANDS[band], MGRS_COLUMNS[(zone - 1) % 3][column], MGRS_ROWS[row])
+                for zone, band, column, row in tiles.T]
+
+    def resolution(self):
+        # Spacing of the MGRS points at the precision of the configuration [m]
+        return 10.0**(5 - self.l1cConfig.mgrs_tile_precision)
+
+    def grid(self, lat, lon):
+        """
+        L1C grid: the MGRS points within the footprint of the L1B pixels
+        :param lat: L1B latitudes [deg]
+        :param lon: L1B longitudes [deg]
+        :return: list of the grids of the UTM zones of the footprint, dictionaries with the 'zone',
+                 'south', the 'lat', 'lon' [deg] and UTM 'easting', 'northing' [m] of the L1C points,
+                 the UTM coordinates of the L1B pixels 'points' (pixels, 2) and their Delaunay 'triangulation',
+                 and the MGRS 'codes' of the L1C points
+        """
+        res = self.resolution()
+        zones = self.utmZone(lat, lon)
+        south = lat < 0
+        grids = []
+        for zone, hemi in sorted(set(zip(zones.ravel().tolist(), south.ravel().tolist()))):
+
+            # All the L1B pixels in the UTM coordinates of the zone, for the interpolation
+            easting, northing = self.toUtm(lat, lon, zone, hemi)
+            points = np.column_stack([np.ravel(easting), np.ravel(northing)])
+            triangulation = Delaunay(points)
+
+            # MGRS points over the bounding box of the pixels of the zone, within the footprint
+            inzone = (zones == zone) & (south == hemi)
+            e = np.arange(np.floor(easting[inzone].min() / res), np.ceil(easting[inzone].max() / res) + 1) * res
+            n = np.arange(np.floor(northing[inzone].min() / res), np.ceil(northing[inzone].max() / res) + 1) * res
+            e, n = [a.ravel() for a in np.meshgrid(e, n)]
+            inside = triangulation.find_simplex(np.column_stack([e, n])) >= 0
+            e, n = e[inside], n[inside]
+
+            # Keep only the points of the zone
+            lat_l1c, lon_l1c = self.fromUtm(e, n, zone, hemi)
+            keep = (self.utmZone(lat_l1c, lon_l1c) == zone) & ((lat_l1c < 0) == hemi)
+            grid = {'zone': zone, 'south': hemi, 'lat': lat_l1c[keep], 'lon': lon_l1c[keep],
+                    'easting': e[keep], 'northing': n[keep], 'points': points, 'triangulation': triangulation}
+            grid['codes'] = self.codes(grid['lat'], zone, grid['easting'], grid['northing'])
+            grids.append(grid)
+
+            self.logger.debug("UTM zone " + str(zone) + ": " + str(keep.sum()) + " L1C points in the MGRS tiles "
+                              + str(self.tileNames(grid['codes'])))
+        return grids
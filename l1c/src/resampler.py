@@ -0,0 +1,166 @@
+
+from l1c.src.initL1c import initL1c
+from l1c.src.mgrsGrid import mgrsGrid
+from common.src.arrayCache import hashKey
+from scipy.spatial import cKDTree
+import scipy.sparse as sp
+import numpy as np
+import threading
+
+class resampler(initL1c):
+    """
+    Resampling of the L1B pixels onto the L1C grid as a sparse matrix, (L1C points, L1B pixels).
+    The weights only depend on the geometry, so the operator is computed once per geolocation
+    and kept in the 'resampling' cache (.npz), together with the L1C grid. Every band, or all
+    the bands stacked as columns, is then resampled with one sparse matrix product.
+    Methods (l1cConfig.resampling):
+    'nearest': nearest L1B pixel, in UTM coordinates
+    'linear': barycentric weights of the Delaunay triangle of the L1B pixels containing the point
+    'cubic': cubic convolution (Keys, a=-0.5) over the 4x4 L1B pixels around the point, at its
+             position in the (ALT, ACT) grid of the L1B (interpolated linearly from the triangle)
+    """
+
+    def __init__(self, auxdir, indir, outdir, context=None):
+        super().__init__(auxdir, indir, outdir, context)
+        self.cache = self.getCache('resampling')
+        self.myGrid = mgrsGrid(self.auxdir, self.indir, self.outdir, self.context)
+        self.operators = {}
+        # One lock per geometry, so that each operator is computed once by the concurrent bands
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def operator(self, lat, lon, geokey):
+        """
+        Resampling operator of a geometry
+        :param lat: L1B latitudes [deg]
+        :param lon: L1B longitudes [deg]
+        :param geokey: key of the geometry (hash of the geolocation file)
+        :return: dictionary with the 'matrix' (scipy.sparse CSR, L1C points x L1B pixels),
+                 and the L1C 'lat' and 'lon' [deg]
+        """
+        method = self.l1cConfig.resampling
+        key = hashKey('resampling', geokey, lat.shape, self.l1cConfig.mgrs_tile_precision, method)
+        with self.lock:
+            lock = self.locks.setdefault(key, threading.Lock())
+        with lock:
+            if key not in self.operators:
+                entry = self.cache.get(key)
+                if entry is None:
+                    self.logger.debug("Computing the " + method + " resampling operator of the L1C grid")
+                    entry = self.cache.put(key, self.compute(lat, lon, method))
+                matrix = sp.csr_matrix((entry['data'], entry['indices'], entry['indptr']), shape=tuple(entry['shape']))
+                self.operators[key] = {'matrix': matrix, 'lat': entry['lat'], 'lon': entry['lon']}
+            return self.operators[key]
+
+    def compute(self, lat, lon, method):
+        """
+        Computes the resampling operator (see operator)
+        :return: dictionary with the CSR arrays ('data', 'indices', 'indptr', 'shape') and the L1C 'lat', 'lon'
+        """
+        grids = self.myGrid.grid(lat, lon)
+        blocks = []
+        for grid in grids:
+            targets = np.column_stack([grid['easting'], grid['northing']])
+            if method == 'nearest':
+                blocks.append(self.nearest(grid['points'], targets))
+            elif method == 'linear':
+                blocks.append(self.linear(grid['triangulation'], targets, lat.size))
+            elif method == 'cubic':
+                blocks.append(self.cubic(grid['triangulation'], targets, lat.shape))
+            else:
+                raise Exception('Unknown resampling method ' + method)
+
+        matrix = sp.vstack(blocks, format='csr')
+        return {'data': matrix.data, 'indices': matrix.indices, 'indptr': matrix.indptr,
+                'shape': np.array(matrix.shape),
+                'lat': np.concatenate([grid['lat'] for grid in grids]),
+                'lon': np.concatenate([grid['lon'] for grid in grids])}
+
+    def nearest(self, points, targets):
+        """
+        Nearest neighbour weights
+        :param points: UTM coordinates of the L1B pixels (pixels, 2) [m]
+        :param targets: UTM coordinates of the L1C points (points, 2) [m]
+        :return: sparse matrix (points, pixels)
+        """
+        _, ipix = cKDTree(points).query(targets)
+        npoints = targets.shape[0]
+        return sp.csr_matrix((np.ones(npoints), (np.arange(npoints), ipix)), shape=(npoints, points.shape[0]))
+
+    def barycentric(self, triangulation, targets):
+        """
+        Triangle of the L1B pixels containing each L1C point, and its barycentric coordinates
+        :param triangulation: Delaunay triangulation of the L1B pixels
+        :param targets: UTM coordinates of the L1C points (points, 2) [m]
+        :return: vertices (points, 3) and weights (points, 3)
+        """
+        simplex = triangulation.find_simplex(targets)
+        transform = triangulation.transform[simplex]
+        bary = np.einsum('ijk,ik->ij', transform[:, :2, :], targets - transform[:, 2, :])
+        weights = np.column_stack([bary, 1 - bary.sum(axis=1)])
+        return triangulation.simplices[simplex], weights
+
+    def linear(self, triangulation, targets, npixels):
+        """
+        Linear (barycentric) weights on the Delaunay triangulation of the L1B pixels
+        :param triangulation: Delaunay triangulation of the L1B pixels
+        :param targets: UTM coordinates of the L1C points (points, 2) [m]
+        :param npixels: number of L1B pixels
+        :return: sparse matrix (points, pixels)
+        """
+        vertices, weights = self.barycentric(triangulation, targets)
+        npoints = targets.shape[0]
+        rows = np.repeat(np.arange(npoints), 3)
+        return sp.csr_matrix((weights.ravel(), (rows, vertices.ravel())), shape=(npoints, npixels))
+
+    def cubic(self, triangulation, targets, shape):
+        """
+        Cubic convolution weights in the (ALT, ACT) grid of the L1B pixels
+        :param triangulation: Delaunay triangulation of the L1B pixels
+        :param targets: UTM coordinates of the L1C points (points, 2) [m]
+        :param shape: shape of the L1B image (ALT, ACT)
+        :return: sparse matrix (points, pixels)
+        """
+        # Position of the points in the L1B grid
+        vertices, weights = self.barycentric(triangulation, targets)
+        ialt, iact = np.unravel_index(vertices, shape)
+        alt = (ialt * weights).sum(axis=1)
+        act = (iact * weights).sum(axis=1)
+
+        # Separable 4x4 kernel, with the pixels beyond the edges replaced by the edge ones
+        alt0 = np.floor(alt).astype(int)
+        act0 = np.floor(act).astype(int)
+        offsets = np.arange(-1, 3)
+        walt = self.keys(alt[:, np.newaxis] - (alt0[:, np.newaxis] + offsets))
+        wact = self.keys(act[:, np.newaxis] - (act0[:, np.newaxis] + offsets))
+        jalt = np.clip(alt0[:, np.newaxis] + offsets, 0, shape[0] - 1)
+        jact = np.clip(act0[:, np.newaxis] + offsets, 0, shape[1] - 1)
+
+        npoints = targets.shape[0]
+        values = (walt[:, :, np.newaxis] * wact[:, np.newaxis, :]).ravel()
+        columns = (jalt[:, :, np.newaxis] * shape[1] + jact[:, np.newaxis, :]).ravel()
+        rows = np.repeat(np.arange(npoints), 16)
+        # Repeated pixels (at the edges) are summed
+        return sp.csr_matrix((values, (rows, columns)), shape=(npoints, shape[0] * shape[1]))
+
+    def keys(self, x, a=-0.5):
+        """
+        Cubic convolution kernel (Keys, 1981)
+        :param x: distance [pixels]
+        :param a: parameter of the kernel
+        :return: weights
+        """
+        x = np.abs(x)
+        return np.where(x <= 1, ((a + 2) * x - (a + 3)) * x**2 + 1,
+                        np.where(x < 2, ((a * x - 5 * a) * x + 8 * a) * x - 4 * a, 0.0))
+
+    def resample(self, operator, toa):
+        """
+        Resamples one band, or several bands at once
+        :param operator: resampling operator (see operator)
+        :param toa: L1B TOA (ALT, ACT), or bands stacked (ALT, ACT, bands)
+        :return: L1C TOA (points), or (points, bands)
+        """
+        npixels = operator['matrix'].shape[1]
+        values = np.reshape(toa, (npixels,) + np.shape(toa)[2:])
+        return operator['matrix'] @ values